@@ -0,0 +1,178 @@
+import asyncio, socket, logging
+from time import monotonic
+
+from ServerWorker import ServerWorker
+from RtspParser import RtspParser, RtspError
+
+log = logging.getLogger(__name__)
+
+class RtpProtocol(asyncio.DatagramProtocol):
+	"""UDP endpoint shared by every session for RTP egress."""
+
+	def connection_made(self, transport):
+		self.transport = transport
+
+	def error_received(self, exc):
+		# ICMP port unreachable from a client that went away; nothing to do
+		pass
+
+class AsyncServerWorker(ServerWorker):
+	"""ServerWorker driven by asyncio streams and a shared datagram transport."""
+
+	def __init__(self, clientInfo, server):
+		super().__init__(clientInfo)
+		self.server = server
+		self.sender = None
+
+	async def serve(self):
+		"""Receive RTSP requests until the client disconnects."""
+		reader = self.clientInfo['reader']
+		parser = RtspParser()
+		self.connected()
+		try:
+			while True:
+				data = await reader.read(self.RTSP_RECV_SIZE)
+				if not data:
+					break
+				for request in parser.feed(data):
+					log.debug("Data received:\n%s", request)
+					if request.method == self.SETUP and self.state == self.INIT:
+						await self.setup(request)
+					else:
+						self.processRtspRequest(request)
+		except RtspError as e:
+			self.badRequest(e)
+		except (OSError, asyncio.IncompleteReadError):
+			pass
+		except Exception as e:
+			log.error("Error receiving data: %s", e)
+		finally:
+			self.closeConnection()
+
+	async def setup(self, request):
+		"""Process a SETUP, indexing its file in a worker thread rather than on the event loop."""
+		seq = request.get('cseq', '0')
+		self.clientInfo['lastActivity'] = monotonic()
+		log.debug("processing SETUP")
+		rtpPort = self.admitSetup(request.headers, seq)
+		if rtpPort is None:
+			return
+		loop = asyncio.get_running_loop()
+		try:
+			stream = await loop.run_in_executor(None, self.openStream, request.uri)
+		except IOError:
+			self.endSession()
+			self.replyRtsp(self.FILE_NOT_FOUND_404, seq)
+			return
+		# later requests on the connection wait, so they are still answered in order
+		self.completeSetup(stream, request.uri, rtpPort, seq)
+
+	def sendRtspReply(self, reply):
+		self.clientInfo['writer'].write(reply.encode())
+
+	def closeRtspSocket(self):
+		self.clientInfo['writer'].close()
+
+	def expire(self):
+		# the reader then sees end of stream
+		self.clientInfo['writer'].transport.abort()
+
+	def clientAddress(self):
+		return self.clientInfo['address'][0]
+
+	def openRtpSocket(self):
+		# every session sends through the server's datagram transport
+		pass
+
+	def closeRtpSocket(self):
+		pass
+
+	def startStreaming(self):
+		self.stopStreaming()
+		self.sender = asyncio.get_running_loop().create_task(self.sendRtpAsync())
+
+	def stopStreaming(self):
+		if self.sender is not None:
+			self.sender.cancel()
+			self.sender = None
+
+	async def sendRtpAsync(self):
+		"""Send RTP packets over the shared UDP transport."""
+		transport = self.server.rtpTransport
+		destination = (self.clientAddress(), int(self.clientInfo['rtpPort']))
+
+		def sendBurst(packets):
+			# the transport may queue the datagram, so header and payload are joined
+			for header, payload in packets:
+				transport.sendto(b''.join((header, payload)), destination)
+			return len(packets), 0
+
+		try:
+			for due in self.rtpSender(sendBurst):
+				await asyncio.sleep(max(0, due - monotonic()))
+		except asyncio.CancelledError:
+			raise
+		except Exception as e:
+			log.exception("Sender error: %s", e)
+
+	def canSendFrame(self):
+		# drop the frame rather than queue it if the socket is backed up
+		return self.server.rtpTransport.get_write_buffer_size() <= self.server.RTP_HIGH_WATER
+
+class AsyncServer:
+	"""Single-process asyncio RTSP/RTP server."""
+	# bytes of RTP that may queue in user space before frames are dropped
+	RTP_HIGH_WATER = 4 * 1024 * 1024
+	RTP_SNDBUF = 4 * 1024 * 1024
+	# longest RTSP line the stream reader buffers
+	RTSP_READ_LIMIT = 16 * 1024
+	BACKLOG = 1024
+
+	def __init__(self, rtspSocket):
+		self.rtspSocket = rtspSocket
+		self.rtpTransport = None
+		self.sessions = set()
+
+	def run(self):
+		"""Serve until interrupted."""
+		asyncio.run(self.main())
+
+	async def main(self):
+		loop = asyncio.get_running_loop()
+		rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		try:
+			rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.RTP_SNDBUF)
+		except OSError:
+			pass
+		rtpSocket.bind(('', 0))
+		self.rtpTransport, _ = await loop.create_datagram_endpoint(RtpProtocol, sock=rtpSocket)
+
+		self.rtspSocket.setblocking(False)
+		server = await asyncio.start_server(self.handleClient, sock=self.rtspSocket,
+			backlog=self.BACKLOG, limit=self.RTSP_READ_LIMIT)
+		reaper = loop.create_task(self.reapIdle())
+		try:
+			async with server:
+				await server.serve_forever()
+		finally:
+			reaper.cancel()
+			self.rtpTransport.close()
+
+	async def reapIdle(self):
+		"""Expire idle sessions every REAP_INTERVAL seconds."""
+		while True:
+			await asyncio.sleep(AsyncServerWorker.REAP_INTERVAL)
+			AsyncServerWorker.reapIdle()
+
+	async def handleClient(self, reader, writer):
+		clientInfo = {}
+		clientInfo['reader'] = reader
+		clientInfo['writer'] = writer
+		clientInfo['address'] = writer.get_extra_info('peername')
+		log.info("Client connected from %s", clientInfo['address'])
+		worker = AsyncServerWorker(clientInfo, self)
+		self.sessions.add(worker)
+		try:
+			await worker.serve()
+		finally:
+			self.sessions.discard(worker)
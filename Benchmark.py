@@ -0,0 +1,265 @@
+import sys, os, time, argparse, tempfile, socket
+
+from VideoStream import FrameScanner, numpy
+from ServerWorker import ServerWorker
+from RtpPacket import HEADER_SIZE
+from FramePacer import FramePacer
+from UdpBatchSender import UdpBatchSender
+from PacketCache import PacketCache
+from RtspParser import RtspParser, RtspMessage
+from itertools import islice
+
+def segment(marker, payload):
+	"""Build a JPEG marker segment."""
+	return bytes((0xFF, marker)) + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+def syntheticJpeg(size, thumbnail=False, dimensions=None):
+	"""Build a structurally valid JPEG with `size` bytes of random entropy-coded data.
+
+	With dimensions (width, height) the frame header declares that size.
+	"""
+	scan = segment(0xDB, os.urandom(65))
+	if dimensions is not None:
+		width, height = dimensions
+		scan += segment(0xC0, b'\x08' + height.to_bytes(2, 'big') + width.to_bytes(2, 'big') + b'\x01\x01\x11\x00')
+	scan += segment(0xDA, b'\x01\x01\x00\x00\x3f\x00')
+	data = b'\xff\xd8' + segment(0xE0, b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00')
+	if thumbnail:
+		# EXIF thumbnail: a complete JPEG (with its own EOI) inside APP1
+		thumb = b'\xff\xd8' + scan + os.urandom(512).replace(b'\xff', b'\xff\x00') + b'\xff\xd9'
+		data += segment(0xE1, b'Exif\x00\x00' + thumb)
+	return data + scan + os.urandom(size).replace(b'\xff', b'\xff\x00') + b'\xff\xd9'
+
+def writeSyntheticMjpeg(path, frames, frameSize, thumbnails=False, dimensions=None):
+	"""Write a standard (concatenated JPEG) MJPEG file."""
+	with open(path, 'wb') as f:
+		for _ in range(frames):
+			f.write(syntheticJpeg(frameSize, thumbnails, dimensions))
+
+def legacyScan(path):
+	"""Frame boundaries as found by the original VideoStream.nextFrame loop."""
+	frames = []
+	with open(path, 'rb') as file:
+		while True:
+			current_pos = file.tell()
+			header = file.read(5)
+			if len(header) == 5 and header.isdigit():
+				data = file.read(int(header))
+				if data:
+					frames.append((current_pos + 5, len(data)))
+					continue
+			file.seek(current_pos)
+			data = b''
+			while True:
+				chunk = file.read(4096)
+				if not chunk:
+					return frames
+				data += chunk
+				eoi_pos = data.find(b'\xff\xd9')
+				if eoi_pos != -1:
+					frames.append((current_pos, eoi_pos + 2))
+					file.seek(current_pos + eoi_pos + 2)
+					break
+
+def scannerScan(path, useNumpy):
+	with open(path, 'rb') as file:
+		return list(FrameScanner(file, useNumpy=useNumpy).frames())
+
+def best(fn, repeat):
+	"""Run fn `repeat` times; return (fastest time, last result)."""
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = fn()
+		times.append(time.perf_counter() - start)
+	return min(times), result
+
+def report(name, seconds, frames, size):
+	print(f"{name:<16} {seconds * 1000:9.1f} ms {frames / seconds:11.0f} frames/s {size / seconds / 1e6:9.1f} MB/s  ({frames} frames)")
+
+def benchScan(args):
+	"""Compare the original frame scanner with FrameScanner."""
+	path = args.file
+	tmp = None
+	if path is None:
+		tmp = tempfile.NamedTemporaryFile(suffix='.Mjpeg', delete=False)
+		tmp.close()
+		path = tmp.name
+		writeSyntheticMjpeg(path, args.frames, args.frame_size, args.thumbnails)
+	try:
+		size = os.path.getsize(path)
+		print(f"{path}: {size / 1e6:.1f} MB")
+		candidates = [('legacy', lambda: legacyScan(path)),
+			('scanner (regex)', lambda: scannerScan(path, False))]
+		if numpy is not None:
+			candidates.append(('scanner (numpy)', lambda: scannerScan(path, True)))
+		for name, fn in candidates:
+			seconds, frames = best(fn, args.repeat)
+			report(name, seconds, len(frames), size)
+	finally:
+		if tmp is not None:
+			os.remove(path)
+
+def udpPair():
+	"""A sender socket and the address of a local receiver that is never read."""
+	receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	receiver.bind(('127.0.0.1', 0))
+	sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	return sender, receiver
+
+def legacySend(worker, sock, destination, frame):
+	"""Per-packet path before scatter-gather: slice, makeRtp, join, sendto."""
+	size = len(frame)
+	offset = 0
+	while offset < size:
+		chunk = frame[offset : offset + worker.MAX_PAYLOAD_SIZE]
+		offset += len(chunk)
+		marker = 1 if offset >= size else 0
+		seqnum = worker.clientInfo['rtpSeqNum']
+		worker.clientInfo['rtpSeqNum'] += 1
+		sock.sendto(worker.makeRtp(chunk, seqnum, int(time.time()), marker), destination)
+
+def sendmsgSend(worker, sock, destination, frame):
+	"""Scatter-gather: reusable header, memoryview payload, one sendmsg per packet."""
+	for header, payload in worker.packetize(PacketCache.fragment(frame, worker.MAX_PAYLOAD_SIZE), 0):
+		sock.sendmsg((header, payload), (), 0, destination)
+
+def batchSend(worker, sock, destination, frame):
+	"""Bursts of FramePacer.BURST packets through UdpBatchSender, cutting every frame."""
+	batchSendFragments(worker, sock, destination, PacketCache.fragment(frame, worker.MAX_PAYLOAD_SIZE))
+
+def batchSendFragments(worker, sock, destination, fragments):
+	"""Current path: a frame already cut by the packet cache, sent in bursts."""
+	sender = UdpBatchSender(sock, destination)
+	packets = worker.packetize(fragments, 0)
+	while True:
+		burst = list(islice(packets, FramePacer.BURST))
+		if not burst:
+			break
+		sender.send(burst)
+
+def benchPacketize(args):
+	"""Packets/sec of the RTP send path: per-packet, scatter-gather and batched."""
+	FramePacer.BURST = args.burst
+	frame = os.urandom(args.frame_size)
+	packetsPerFrame = -(-len(frame) // ServerWorker.MAX_PAYLOAD_SIZE)
+	sock, receiver = udpPair()
+	destination = receiver.getsockname()
+	candidates = [('makeRtp+sendto', legacySend)]
+	if hasattr(socket.socket, 'sendmsg'):
+		candidates.append(('sendmsg', sendmsgSend))
+	if UdpBatchSender.useGso:
+		candidates.append((f'GSO burst={FramePacer.BURST}', batchSend))
+	fragments = PacketCache.fragment(frame, ServerWorker.MAX_PAYLOAD_SIZE)
+	candidates.append(('+packet cache', lambda worker, sock, destination, frame:
+		batchSendFragments(worker, sock, destination, fragments)))
+	try:
+		for name, send in candidates:
+			worker = ServerWorker({'rtpSeqNum': 0, 'ssrc': ServerWorker.RTP_SSRC, 'rtpHeaders': memoryview(bytearray(HEADER_SIZE * FramePacer.BURST))})
+			frames = 0
+			start = time.perf_counter()
+			while time.perf_counter() - start < args.seconds:
+				send(worker, sock, destination, frame)
+				frames += 1
+			seconds = time.perf_counter() - start
+			packets = frames * packetsPerFrame
+			print(f"{name:<16} {packets / seconds:11.0f} packets/s {frames * len(frame) * 8 / seconds / 1e6:9.1f} Mbit/s")
+	finally:
+		sock.close()
+		receiver.close()
+
+def sampleRtspMessages():
+	"""A typical request/reply mix of a playing session: PLAY, feedback, and their replies."""
+	body = b"loss: 0.0012\r\nbuffer: 180\r\nstalled: 0\r\n"
+	return [
+		RtspMessage.request('PLAY', 'movie.Mjpeg', [('CSeq', 2), ('Session', 123456), ('Range', 'frame=120-')]).encode(),
+		RtspMessage.response(200, [('CSeq', 2), ('Session', 123456), ('Range', 'frame=120-'),
+			('RTP-Info', 'url=movie.Mjpeg;seq=0;rtptime=3600000')]).encode(),
+		RtspMessage.request('SET_PARAMETER', 'movie.Mjpeg', [('CSeq', 3), ('Session', 123456),
+			('Content-Type', 'text/parameters')], body).encode(),
+		RtspMessage.response(200, [('CSeq', 3), ('Session', 123456)]).encode(),
+	]
+
+def legacyRtspParse(data):
+	"""Parsing before RtspParser: one message per read, fields by line position."""
+	lines = data.decode('utf-8').split('\n')
+	first = lines[0].split(' ')
+	headers = {}
+	for line in lines[1:]:
+		name, sep, value = line.partition(':')
+		if sep:
+			headers[name.strip().lower()] = value.strip()
+	return first, headers
+
+def feedChunks(data, sizes):
+	"""Feed data to a new parser in chunks of the given sizes (cycled); return the messages."""
+	parser = RtspParser()
+	messages = []
+	pos = 0
+	i = 0
+	while pos < len(data):
+		size = sizes[i % len(sizes)]
+		messages += parser.feed(data[pos:pos + size])
+		pos += size
+		i += 1
+	return messages
+
+def benchRtsp(args):
+	"""Messages/sec of RTSP parsing: whole messages, pipelined batches and small chunks."""
+	messages = sampleRtspMessages()
+	stream = b''.join(messages) * (args.messages // len(messages))
+	count = len(messages) * (args.messages // len(messages))
+	size = len(stream)
+
+	def oneByOne():
+		parser = RtspParser()
+		parsed = 0
+		for _ in range(args.messages // len(messages)):
+			for message in messages:
+				parsed += len(parser.feed(message))
+		return parsed
+
+	candidates = [
+		('legacy split', lambda: sum(1 for _ in range(args.messages // len(messages)) for m in messages if legacyRtspParse(m))),
+		('one per read', oneByOne),
+		(f'pipelined x{args.pipeline}', lambda: feedChunks(stream, [len(b''.join(messages)) * args.pipeline // len(messages)])),
+		(f'{args.chunk}-byte reads', lambda: feedChunks(stream, [args.chunk])),
+	]
+	for name, fn in candidates:
+		seconds, result = best(fn, args.repeat)
+		parsed = result if isinstance(result, int) else len(result)
+		if parsed != count:
+			print(f"{name}: parsed {parsed} of {count} messages")
+		print(f"{name:<16} {seconds * 1000:9.1f} ms {count / seconds:11.0f} msgs/s {size / seconds / 1e6:9.1f} MB/s")
+
+def main():
+	parser = argparse.ArgumentParser(description="Micro-benchmarks for the streaming hot paths.")
+	sub = parser.add_subparsers(dest='bench', required=True)
+
+	scan = sub.add_parser('scan', help="MJPEG frame boundary scanning")
+	scan.add_argument('file', nargs='?', help="MJPEG file (default: synthetic)")
+	scan.add_argument('--frames', type=int, default=500)
+	scan.add_argument('--frame-size', type=int, default=200000, help="bytes of image data per frame")
+	scan.add_argument('--thumbnails', action='store_true',
+		help="embed EXIF thumbnails (the legacy scanner splits these frames in two)")
+	scan.add_argument('--repeat', type=int, default=3)
+	scan.set_defaults(func=benchScan)
+
+	packetize = sub.add_parser('packetize', help="RTP packetization and UDP send")
+	packetize.add_argument('--frame-size', type=int, default=100000)
+	packetize.add_argument('--seconds', type=float, default=2.0, help="duration of each run")
+	packetize.add_argument('--burst', type=int, default=FramePacer.BURST, help="packets per batched send")
+	packetize.set_defaults(func=benchPacketize)
+
+	rtsp = sub.add_parser('rtsp', help="RTSP message parsing")
+	rtsp.add_argument('--messages', type=int, default=100000)
+	rtsp.add_argument('--pipeline', type=int, default=16, help="messages per read when pipelined")
+	rtsp.add_argument('--chunk', type=int, default=7, help="bytes per read in the split-reads run")
+	rtsp.add_argument('--repeat', type=int, default=3)
+	rtsp.set_defaults(func=benchRtsp)
+
+	args = parser.parse_args()
+	args.func(args)
+
+if __name__ == "__main__":
+	main()
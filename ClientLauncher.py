@@ -1,20 +1,40 @@
-import sys
-from tkinter import Tk
-from Client import Client
+import sys, argparse
 
 if __name__ == "__main__":
-	try:
-		serverAddr = sys.argv[1]
-		serverPort = sys.argv[2]
-		rtpPort = sys.argv[3]
-		fileName = sys.argv[4]	
-	except:
-		print("[Usage: ClientLauncher.py Server_name Server_port RTP_port Video_file]\n")	
-	
+	parser = argparse.ArgumentParser(usage="ClientLauncher.py Server_name Server_port RTP_port Video_file [--low-latency | --headless]")
+	parser.add_argument('serverAddr')
+	parser.add_argument('serverPort')
+	parser.add_argument('rtpPort')
+	parser.add_argument('fileName')
+	parser.add_argument('--headless', action='store_true',
+		help="no window: receive at full network speed and print throughput and loss every second")
+	parser.add_argument('--sink', choices=('discard', 'dir', 'stdout'), default='discard',
+		help="with --headless: drop frames, write them to --output-dir, or write an MJPEG stream to stdout")
+	parser.add_argument('--output-dir', default='frames', help="directory for --sink dir")
+	parser.add_argument('--low-latency', action='store_true',
+		help="live mode: start after a jitter-sized buffer (not 200 frames) and drop frames to stay close to live")
+	parser.add_argument('--duration', type=float, help="with --headless: seconds to play (default: until the stream ends)")
+	args = parser.parse_args()
+
+	if args.headless:
+		from HeadlessClient import HeadlessClient, FrameSink, DirectorySink, StreamSink
+		if args.sink == 'stdout':
+			sink = StreamSink(sys.stdout.buffer)
+			# stdout carries the frames; messages go to stderr
+			sys.stdout = sys.stderr
+		elif args.sink == 'dir':
+			sink = DirectorySink(args.output_dir)
+		else:
+			sink = FrameSink()
+		client = HeadlessClient(args.serverAddr, args.serverPort, args.rtpPort, args.fileName, sink)
+		sys.exit(client.run(args.duration))
+
+	from tkinter import Tk
+	from Client import Client
+
 	root = Tk()
-	
+
 	# Create a new client
-	app = Client(root, serverAddr, serverPort, rtpPort, fileName)
-	app.master.title("RTPClient")	
+	app = Client(root, args.serverAddr, args.serverPort, args.rtpPort, args.fileName, lowLatency=args.low_latency)
+	app.master.title("RTPClient")
 	root.mainloop()
-	
\ No newline at end of file
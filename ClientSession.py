@@ -0,0 +1,633 @@
+import socket
+import threading
+import time
+import random
+
+from FrameAssembler import FrameAssembler
+from RtpReceiver import RtpReceiver
+from FrameArena import FrameArena
+from RtcpPacket import RtcpPacket, ReceptionStats, RTCP_SR
+from RtspParser import RtspParser, RtspMessage, RtspError
+
+
+class ClientSession:
+    """One RTSP/RTP client session, without a user interface.
+
+    Sends SETUP/PLAY/PAUSE/TEARDOWN and receiver feedback, matches replies
+    to requests, receives RTP into reassembled frames and exchanges RTCP
+    reports. Received frames go to frameReceived() with their RTP
+    timestamp, which stores them in the frame arena for a player;
+    subclasses override it to consume frames some other way, and override
+    setStatus(), warn() and paused() to show the session's progress.
+    """
+    INIT = 0
+    READY = 1
+    PLAYING = 2
+    state = INIT
+
+    SETUP = 0
+    PLAY = 1
+    PAUSE = 2
+    TEARDOWN = 3
+    SET_PARAMETER = 4
+    GET_PARAMETER = 5
+
+    RTP_RCVBUF = 4 << 20        # kernel receive buffer for RTP (bytes)
+    FRAME_BUFFER_BYTES = 64 << 20  # memory for received frames, played and upcoming
+    FEEDBACK_INTERVAL = 1.0     # seconds between loss/buffer reports to the server
+    RTP_CLOCK_RATE = 90000      # RTP timestamp units per second (JPEG video)
+    RTCP_INTERVAL = 1.0         # seconds between RTCP receiver reports
+    TEARDOWN_WAIT = 2.0         # seconds close() waits for the TEARDOWN reply
+    SESSION_TIMEOUT = 60        # server's session timeout when its Session header gives none
+
+    def __init__(self, serveraddr, serverport, rtpport, filename):
+        self.serverAddr = serveraddr
+        self.serverPort = int(serverport)
+        self.rtpPort = int(rtpport)
+        self.fileName = filename
+        self.rtspSeq = 0
+        self.sessionId = 0
+        self.requestSent = -1
+        self.pendingRequests = {}                # CSeq -> request code awaiting its reply
+        self.replyListener = False
+        self.rtspLock = threading.Lock()
+        self.lastRequestTime = time.monotonic()
+        self.sessionTimeout = self.SESSION_TIMEOUT
+        self.teardownAcked = 0
+        self.connectToServer()
+        self.frameNbr = 0
+
+        # frame đã hiển thị (trước playhead) và frame tương lai (sau playhead)
+        self.frames = FrameArena(self.FRAME_BUFFER_BYTES)
+        self.isBuffering = False                 # flag: đang preload/re-buffer
+        self.rebuffering = False                 # flag: hết frame giữa chừng (báo server giảm chất lượng)
+
+        # receiver feedback for the server's rendition choice
+        self.nextFeedback = 0.0
+        self.lastFeedback = (0, 0)               # (packets received, packets lost) at the last report
+
+        # playback control: the running RTP listener and the event that stops it
+        self.playEvent = None
+        self.rtpThread = None
+
+        # server-side seek (PLAY with Range) when the target is not buffered
+        self.playStartFrame = 0                  # media frame of the first frame since the last seek
+        self.playStartNumber = 0                 # its number in the frame arena
+        self.seekFrame = None                    # target of a seek awaiting its reply
+        self.seekSeq = None                      # CSeq of that seek's PLAY request
+        self.seekStart = None                    # (frame, RTP seq) for the listener to restart at
+
+
+    # ============================================================
+    # USER INTERFACE HOOKS
+    # ============================================================
+    def setStatus(self, text, color="blue"):
+        pass
+
+    def warn(self, title, message):
+        print(f"{title}: {message}")
+
+    def paused(self):
+        # PAUSE acknowledged: stop the RTP listener
+        if self.playEvent:
+            self.playEvent.set()
+        self.setStatus("Paused")
+
+
+    # ============================================================
+    # SESSION CONTROL
+    # ============================================================
+    def setupMovie(self):
+        if self.state == self.INIT:
+            self.sendRtspRequest(self.SETUP)
+
+    def playMovie(self):
+        # start the RTP listener, then ask the server to stream
+        if self.state != self.READY:
+            return False
+        self.startListener()
+
+        # send PLAY to server (server should start sending RTP)
+        self.sendRtspRequest(self.PLAY)
+        return True
+
+    def startListener(self):
+        # one RTP listener at a time, each with its own stop event
+        self.stopListener()
+        self.playEvent = threading.Event()
+        self.rtpThread = threading.Thread(target=self.listenRtp, args=(self.playEvent,), daemon=True)
+        self.rtpThread.start()
+
+    def stopListener(self):
+        # stop the RTP listener and wait until it no longer touches the receiver and assembler
+        if self.playEvent:
+            self.playEvent.set()
+        thread = self.rtpThread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.rtpThread = None
+
+    def pauseMovie(self):
+        if self.state == self.PLAYING:
+            self.sendRtspRequest(self.PAUSE)
+            # set playEvent so listener loop can detect and exit if necessary
+            if hasattr(self, 'playEvent') and self.playEvent is not None:
+                self.playEvent.set()
+
+    def close(self):
+        # send TEARDOWN, then close every socket
+        if self.state != self.INIT:
+            try:
+                # send TEARDOWN; do not force-close socket here — wait for reply or timeout
+                self.sendRtspRequest(self.TEARDOWN)
+            except:
+                pass
+
+            # wait briefly for teardown acknowledgement
+            wait_until = time.time() + self.TEARDOWN_WAIT
+            while time.time() < wait_until and self.teardownAcked == 0:
+                time.sleep(0.01)
+
+        # stop the RTP listener before its receiver goes away
+        self.stopListener()
+        self.closeRtpReceiver()
+
+        # the RTCP listener exits once its socket is closed
+        try:
+            if hasattr(self, 'rtcpSocket') and self.rtcpSocket is not None:
+                self.rtcpSocket.close()
+        except:
+            pass
+
+        try:
+            # try to close RTP socket
+            if hasattr(self, 'rtpSocket') and self.rtpSocket is not None:
+                try:
+                    self.rtpSocket.shutdown(socket.SHUT_RDWR)
+                except:
+                    pass
+                try:
+                    self.rtpSocket.close()
+                except:
+                    pass
+        except:
+            pass
+
+        # try to close RTSP socket if still open
+        try:
+            if hasattr(self, 'rtspSocket') and self.rtspSocket is not None:
+                try:
+                    self.rtspSocket.shutdown(socket.SHUT_RDWR)
+                except:
+                    pass
+                try:
+                    self.rtspSocket.close()
+                except:
+                    pass
+        except:
+            pass
+
+
+    # ============================================================
+    # RTP LISTENER
+    # ============================================================
+    def listenRtp(self, stopEvent):
+        # If rtpSocket isn't open yet, try to open (in case SETUP already called openRtpPort)
+        # Usually openRtpPort is called after SETUP reply; keep trying a couple times.
+        tries = 0
+        while not hasattr(self, 'rtpReceiver') and tries < 200:
+            time.sleep(0.01)
+            tries += 1
+
+        # the server numbers packets from 0 again on every PLAY
+        self.assembler.reset()
+        while not stopEvent.is_set():
+            try:
+                self.applySeek()
+                self.sendFeedback()
+                # a batch of datagrams, decoded in place in the receive ring
+                packets = self.rtpReceiver.receive()
+                arrival = time.monotonic()
+                for pkt in packets:
+                    # RTCP loss and jitter counters (RFC 3550)
+                    self.reception.update(pkt.ssrc(), pkt.seqNum(), pkt.timestamp(), arrival)
+                    # frames come out whole, in sequence order, once all their packets are in
+                    for timestamp, frameData in self.assembler.pushPacket(pkt):
+                        self.frameReceived(frameData, timestamp)
+            except Exception:
+                # if paused or user requested stop -> exit
+                if stopEvent.is_set():
+                    break
+                # if teardown acknowledged -> close socket and exit
+                if self.teardownAcked == 1:
+                    try:
+                        if hasattr(self, 'rtpSocket') and self.rtpSocket is not None:
+                            try:
+                                self.rtpSocket.shutdown(socket.SHUT_RDWR)
+                            except:
+                                pass
+                            try:
+                                self.rtpSocket.close()
+                            except:
+                                pass
+                    except:
+                        pass
+                    break
+                # socket timeout or other error -> continue listening
+                continue
+
+
+    def sendFeedback(self):
+        # báo cáo mất gói và bộ đệm cho server mỗi FEEDBACK_INTERVAL giây
+        now = time.monotonic()
+        if now < self.nextFeedback or self.state != self.PLAYING or self.seekFrame is not None:
+            return
+        self.nextFeedback = now + self.FEEDBACK_INTERVAL
+        received, lost = self.packetCounts()
+        newReceived, newLost = received - self.lastFeedback[0], lost - self.lastFeedback[1]
+        self.lastFeedback = (received, lost)
+        total = newReceived + newLost
+        params = {
+            'loss': f"{newLost / total if total > 0 else 0.0:.4f}",
+            'stalled': 1 if self.rebuffering else 0,
+        }
+        buffered = self.feedbackBuffer()
+        if buffered is not None:
+            params['buffer'] = buffered
+        self.sendRtspRequest(self.SET_PARAMETER, params=params)
+
+    def feedbackBuffer(self):
+        # frames ahead of the playhead for the server's rendition choice; None leaves them out
+        return self.frames.futureCount()
+
+    def packetCounts(self):
+        # (packets received, packets lost) since SETUP
+        stats = self.assembler.stats()
+        # datagrams the kernel dropped never reached the assembler
+        return stats['received'], stats['lost'] + self.rtpReceiver.stats()['kernelDrops']
+
+    def frameReceived(self, frameData, timestamp):
+        if self.seekFrame is not None:
+            # still the old position; the server is about to restart elsewhere
+            return
+
+        # copied into the arena; the oldest played frames make room when it is full.
+        # The RTP timestamp (media time) says when the player shows it.
+        self.frames.append(frameData, timestamp)
+
+
+    # ============================================================
+    # TUA FRAME
+    # ============================================================
+    def seekFrames(self, offset):
+        # allow seek when playing or paused (READy or PLAYING). If not playing, refuse.
+        if self.state not in (self.PLAYING, self.READY):
+            self.setStatus("Cannot seek right now", "red")
+            return
+
+        # within the buffered frames only the playhead moves
+        if -self.frames.pastCount() <= offset <= self.frames.futureCount():
+            moved = self.frames.seek(offset)
+            if offset < 0:
+                self.setStatus(f"Rewind {-moved} frames")
+            else:
+                self.setStatus(f"Forward {moved} frames")
+            return
+
+        # outside the buffers: ask the server to stream from the target frame
+        target = max(0, self.mediaFrame() + offset)
+        if self.state == self.READY:
+            self.startListener()
+        self.seekFrame = target
+        self.sendRtspRequest(self.PLAY, rangeFrame=target)
+        self.setStatus(f"Seeking to frame {target}...", "orange")
+
+    def mediaFrame(self):
+        # frame number in the video of the frame at the playhead
+        playhead = self.frames.endNumber() - self.frames.futureCount()
+        return self.playStartFrame + playhead - self.playStartNumber
+
+    def applySeek(self):
+        # called by the RTP listener: drop the old position's frames and packets
+        seek = self.seekStart
+        if seek is None:
+            return
+        self.seekStart = None
+        frame, seq = seek
+        self.assembler.skipTo(seq)
+        self.frames.clear()
+        self.playStartFrame = frame
+        self.playStartNumber = self.frames.endNumber()
+        self.seekFrame = None
+
+
+    # ============================================================
+    # RTSP PROCESS
+    # ============================================================
+    def connectToServer(self):
+        self.rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.rtspSocket.connect((self.serverAddr, self.serverPort))
+        except Exception:
+            self.warn('Connection Failed', f"Cannot connect to {self.serverAddr}")
+
+    def sendRtspRequest(self, requestCode, rangeFrame=None, params=None):
+        # the RTP listener sends feedback too, so numbering and sending are serialised
+        with self.rtspLock:
+            if requestCode == self.SETUP and self.state == self.INIT:
+                # one reply listener, also when an earlier SETUP was refused
+                if not self.replyListener:
+                    self.replyListener = True
+                    threading.Thread(target=self.recvRtspReply, daemon=True).start()
+                self.rtspSeq += 1
+                request = RtspMessage.request("SETUP", self.fileName, [
+                    ("CSeq", self.rtspSeq),
+                    ("Transport", f"RTP/UDP;client_port={self.rtpPort}"),
+                ])
+                self.requestSent = self.SETUP
+
+            elif requestCode == self.PLAY and self.state in (self.READY, self.PLAYING):
+                self.rtspSeq += 1
+                request = RtspMessage.request("PLAY", self.fileName, [
+                    ("CSeq", self.rtspSeq),
+                    ("Session", self.sessionId),
+                ])
+                if rangeFrame is not None:
+                    request.set("Range", f"frame={rangeFrame}-")
+                    # only the reply to the latest seek moves the stream
+                    self.seekSeq = self.rtspSeq
+                self.requestSent = self.PLAY
+
+            elif requestCode == self.PAUSE and self.state == self.PLAYING:
+                self.rtspSeq += 1
+                request = RtspMessage.request("PAUSE", self.fileName, [
+                    ("CSeq", self.rtspSeq),
+                    ("Session", self.sessionId),
+                ])
+                self.requestSent = self.PAUSE
+
+            elif requestCode == self.TEARDOWN and self.state != self.INIT:
+                self.rtspSeq += 1
+                request = RtspMessage.request("TEARDOWN", self.fileName, [
+                    ("CSeq", self.rtspSeq),
+                    ("Session", self.sessionId),
+                ])
+                self.requestSent = self.TEARDOWN
+
+            elif requestCode == self.GET_PARAMETER and self.state != self.INIT:
+                # keep-alive; does not change requestSent
+                self.rtspSeq += 1
+                request = RtspMessage.request("GET_PARAMETER", self.fileName, [
+                    ("CSeq", self.rtspSeq),
+                    ("Session", self.sessionId),
+                ])
+
+            elif requestCode == self.SET_PARAMETER and self.state == self.PLAYING:
+                # receiver feedback; does not change requestSent
+                self.rtspSeq += 1
+                body = "".join(f"{name}: {value}\r\n" for name, value in params.items())
+                request = RtspMessage.request("SET_PARAMETER", self.fileName, [
+                    ("CSeq", self.rtspSeq),
+                    ("Session", self.sessionId),
+                    ("Content-Type", "text/parameters"),
+                ], body.encode())
+            else:
+                return
+
+            # replies are matched to requests by CSeq
+            self.pendingRequests[self.rtspSeq] = requestCode
+            self.lastRequestTime = time.monotonic()
+            try:
+                self.rtspSocket.sendall(request.encode())
+            except Exception:
+                print("Failed to send RTSP request")
+
+        if requestCode not in (self.SET_PARAMETER, self.GET_PARAMETER):
+            print("\nSent:\n" + str(request))
+
+    def keepAlive(self):
+        # giữ session trên server khi không có yêu cầu nào khác (ví dụ khi pause):
+        # GET_PARAMETER sau nửa thời gian timeout của session
+        while self.state != self.INIT and self.teardownAcked == 0:
+            wait = self.lastRequestTime + self.sessionTimeout / 2 - time.monotonic()
+            if wait <= 0:
+                self.sendRtspRequest(self.GET_PARAMETER)
+                continue
+            time.sleep(min(wait, 1.0))
+
+    def recvRtspReply(self):
+        # Listener thread for RTSP replies.
+        parser = RtspParser()
+        while True:
+            try:
+                reply = self.rtspSocket.recv(4096)
+            except Exception as e:
+                # If socket closed or error occurs, exit gracefully
+                # If we already got TEARDOWN ack, break quietly
+                if self.teardownAcked == 1:
+                    break
+                # otherwise print debug and break
+                print("RTSP receive error:", e)
+                break
+
+            if not reply:
+                # the server closed the connection: after TEARDOWN, or it timed the session out
+                if self.teardownAcked == 0:
+                    self.state = self.INIT
+                    if self.playEvent:
+                        self.playEvent.set()
+                    self.setStatus("Connection closed by server", "red")
+                break
+
+            try:
+                # a read may hold part of a reply, or several replies
+                messages = parser.feed(reply)
+            except RtspError as e:
+                print("Failed parsing RTSP reply:", e)
+                break
+            for message in messages:
+                try:
+                    self.parseRtspReply(message)
+                except Exception as e:
+                    print("Failed handling RTSP reply:", e)
+
+            # If TEARDOWN was requested and acked, close socket and exit
+            if self.requestSent == self.TEARDOWN and self.teardownAcked == 1:
+                try:
+                    if hasattr(self, 'rtspSocket') and self.rtspSocket is not None:
+                        try:
+                            self.rtspSocket.shutdown(socket.SHUT_RDWR)
+                        except:
+                            pass
+                        try:
+                            self.rtspSocket.close()
+                        except:
+                            pass
+                except:
+                    pass
+                break
+
+    def parseRtspReply(self, reply):
+        seqNum = reply.cseq
+        if seqNum is None or not reply.isResponse():
+            return
+
+        request = self.pendingRequests.pop(seqNum, None)
+        if request is not None:
+            # Session: id;timeout=seconds
+            fields = reply.get('session', '0').split(';')
+            try:
+                session = int(fields[0])
+            except ValueError:
+                session = 0
+
+            if self.sessionId == 0:
+                self.sessionId = session
+            for field in fields[1:]:
+                name, sep, value = field.partition('=')
+                if name.strip().lower() == 'timeout' and value.strip().isdigit() and int(value) > 0:
+                    self.sessionTimeout = int(value)
+
+            code = reply.statusCode
+
+            if code == 200:
+                if request == self.SETUP:
+                    self.state = self.READY
+                    self.openRtpPort()
+                    self.clearBuffer()
+                    self.setStatus("Setup done – Ready")
+                    threading.Thread(target=self.keepAlive, daemon=True).start()
+
+                elif request == self.PLAY:
+                    # server accepted PLAY; keep state playing
+                    self.state = self.PLAYING
+                    if self.seekFrame is not None and seqNum == self.seekSeq:
+                        self.seekAccepted(reply.headers)
+                    # if we are still buffering, renderer will wait; otherwise start rendering
+                    if not self.isBuffering:
+                        self.setStatus("Playing")
+                    else:
+                        self.setStatus("Buffering before play...", "orange")
+
+                elif request == self.PAUSE:
+                    self.state = self.READY
+                    self.paused()
+
+                elif request == self.TEARDOWN:
+                    # Proper teardown: update state, mark ack
+                    self.state = self.INIT
+                    self.teardownAcked = 1
+                    self.clearBuffer()
+                    self.setStatus("Closed session", "red")
+
+            elif code == 457 and request == self.PLAY and seqNum == self.seekSeq:
+                self.seekFrame = None
+                self.setStatus("Cannot seek there", "red")
+
+            elif request == self.SETUP:
+                if code == 453:
+                    self.warn('Server Busy', "The server has no room for another session; try again later")
+                else:
+                    self.warn('Setup Failed', f"{reply.startLine}")
+                self.setStatus(f"Setup failed ({code})", "red")
+
+    def seekAccepted(self, headers):
+        # Range: frame=N- is where the stream now starts, RTP-Info seq= its first packet
+        try:
+            frame = int(headers['range'].split('=', 1)[1].split('-', 1)[0])
+            rtpInfo = dict(field.split('=', 1) for field in headers['rtp-info'].split(';') if '=' in field)
+            seq = int(rtpInfo['seq'])
+        except (KeyError, IndexError, ValueError):
+            self.seekFrame = None
+            return
+        self.seekStart = (frame, seq)
+
+
+    # ============================================================
+    # RTP SOCKET
+    # ============================================================
+    def openRtpPort(self):
+        # a new SETUP replaces the previous session's receiver
+        self.stopListener()
+        self.closeRtpReceiver()
+        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.rtpSocket.bind(("", self.rtpPort))
+        except Exception:
+            self.warn('Unable to Bind', f"Port {self.rtpPort} cannot bind")
+
+        # packets stay in the receive ring until their frame is reassembled
+        self.assembler = FrameAssembler()
+        receiver = RtpReceiver(self.rtpSocket, rcvbuf=self.RTP_RCVBUF, timeout=0.5)
+        self.assembler.maxAge = receiver.maxAge()
+        self.reception = ReceptionStats(self.RTP_CLOCK_RATE)
+        self.rtpReceiver = receiver
+
+        # RTCP on the next port up: sender reports in, receiver reports out
+        self.rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.rtcpSocket.bind(("", self.rtpPort + 1))
+        except Exception:
+            print(f"RTCP port {self.rtpPort + 1} cannot bind; no RTCP reports")
+            self.rtcpSocket.close()
+            self.rtcpSocket = None
+            return
+        self.rtcpSsrc = random.randint(1, 0xFFFFFFFF)
+        threading.Thread(target=self.listenRtcp, daemon=True).start()
+
+    def closeRtpReceiver(self):
+        # release the receiver's selector (the RTP socket is closed separately);
+        # its counters stay readable for the final report
+        if hasattr(self, 'rtpReceiver'):
+            self.rtpReceiver.close()
+
+    def listenRtcp(self):
+        # nhận SR từ server, gửi RR định kỳ về địa chỉ đã gửi SR
+        rtcpSocket = self.rtcpSocket
+        rtcpSocket.settimeout(self.RTCP_INTERVAL)
+        serverAddr = None
+        nextReport = time.monotonic() + self.RTCP_INTERVAL
+        while self.teardownAcked == 0:
+            try:
+                data, address = rtcpSocket.recvfrom(2048)
+                packets = RtcpPacket.decodeCompound(data)
+            except socket.timeout:
+                packets = ()
+            except ValueError:
+                continue
+            except OSError:
+                # socket closed on exit
+                break
+            now = time.monotonic()
+            for packet in packets:
+                if packet.packetType == RTCP_SR and packet.ssrc == self.reception.ssrc:
+                    self.reception.senderReport(packet, now)
+                    serverAddr = address
+            if serverAddr is None or now < nextReport:
+                continue
+            nextReport = now + self.RTCP_INTERVAL
+            report = RtcpPacket.compound(
+                RtcpPacket.receiverReport(self.rtcpSsrc, [self.reception.report(now)]),
+                RtcpPacket.sourceDescription(self.rtcpSsrc, f"client@{socket.gethostname()}"))
+            try:
+                rtcpSocket.sendto(report, serverAddr)
+            except OSError:
+                pass
+
+    def rtcpStats(self):
+        # jitter (s), packets expected/received/lost and loss fraction of the RTP stream,
+        # plus the server's packet and octet counts from its latest sender report
+        if not hasattr(self, 'reception'):
+            return {}
+        return self.reception.stats()
+
+
+    # ============================================================
+    # CLEAR BUFFER
+    # ============================================================
+    def clearBuffer(self):
+        try:
+            self.frames.clear()
+            self.setStatus("Buffer cleared")
+        except Exception:
+            pass
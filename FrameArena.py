@@ -0,0 +1,130 @@
+import threading
+from collections import deque
+
+
+class FrameArena:
+    """Frames stored back to back in one fixed-size ring buffer, with a playhead.
+
+    Frames before the playhead have been played (kept for rewind), frames
+    from the playhead on are still to come. Memory use is the byte budget
+    whatever the frame size: when a new frame does not fit, the oldest
+    frames are evicted, played ones first. Seeking only moves the playhead.
+
+    Frames are numbered in arrival order. A frame is returned as a copy
+    taken under the lock, since its slot may be reused by the next append()
+    once it is evicted or cleared while the render thread and the decode
+    pool are still reading it. Each frame keeps the RTP timestamp it was
+    stored with, for playout. All methods may be called from any thread.
+    """
+    BUDGET = 64 << 20
+
+    def __init__(self, budget=None):
+        self.budget = budget or self.BUDGET
+        self.arena = memoryview(bytearray(self.budget))
+        self.entries = deque()   # (offset, length, timestamp) of each stored frame, oldest first
+        self.base = 0            # number of entries[0]
+        self.playhead = 0        # index into entries of the next frame to play
+        self.used = 0
+        self.dropped = 0         # frames evicted before they were played
+        self.lock = threading.Lock()
+
+    def append(self, data, timestamp=None):
+        """Store a frame after the newest one; return False if it can never fit."""
+        size = len(data)
+        with self.lock:
+            if size > self.budget:
+                self.dropped += 1
+                return False
+            offset = self.allocate(size)
+            self.arena[offset:offset + size] = data
+            self.entries.append((offset, size, timestamp))
+            self.used += size
+        return True
+
+    def allocate(self, size):
+        """Find room for size bytes after the newest frame, evicting the oldest frames."""
+        entries = self.entries
+        while entries:
+            head = entries[0][0]
+            tail = entries[-1][0] + entries[-1][1]
+            if entries[-1][0] >= head:
+                # stored frames are one run [head, tail)
+                if self.budget - tail >= size:
+                    return tail
+                if head >= size:
+                    return 0
+            elif head - tail >= size:
+                # wrapped: free space is [tail, head)
+                return tail
+            self.evict()
+        return 0
+
+    def evict(self):
+        """Drop the oldest frame."""
+        offset, size, timestamp = self.entries.popleft()
+        self.used -= size
+        self.base += 1
+        if self.playhead > 0:
+            self.playhead -= 1
+        else:
+            self.dropped += 1
+
+    def next(self):
+        """Get (number, frame) at the playhead and move past it, or None if there is none."""
+        with self.lock:
+            if self.playhead >= len(self.entries):
+                return None
+            offset, size, timestamp = self.entries[self.playhead]
+            number = self.base + self.playhead
+            self.playhead += 1
+            return number, bytes(self.arena[offset:offset + size])
+
+    def peek(self, count):
+        """Get (number, frame) of up to count frames from the playhead on, without moving it."""
+        with self.lock:
+            end = min(len(self.entries), self.playhead + count)
+            frames = []
+            for i in range(self.playhead, end):
+                offset, size, timestamp = self.entries[i]
+                frames.append((self.base + i, bytes(self.arena[offset:offset + size])))
+            return frames
+
+    def nextTimestamp(self):
+        """Get the timestamp of the frame at the playhead, or None if there is none."""
+        with self.lock:
+            if self.playhead >= len(self.entries):
+                return None
+            return self.entries[self.playhead][2]
+
+    def seek(self, offset):
+        """Move the playhead by offset frames within what is stored; return how far it moved."""
+        with self.lock:
+            target = max(0, min(len(self.entries), self.playhead + offset))
+            moved = target - self.playhead
+            self.playhead = target
+            return moved
+
+    def pastCount(self):
+        """Get the number of played frames kept for rewind."""
+        return self.playhead
+
+    def futureCount(self):
+        """Get the number of frames still to play."""
+        return len(self.entries) - self.playhead
+
+    def endNumber(self):
+        """Get the number the next appended frame will get."""
+        with self.lock:
+            return self.base + len(self.entries)
+
+    def usedBytes(self):
+        """Get the bytes taken by stored frames."""
+        return self.used
+
+    def clear(self):
+        """Drop every frame."""
+        with self.lock:
+            self.base += len(self.entries)
+            self.entries.clear()
+            self.playhead = 0
+            self.used = 0
@@ -0,0 +1,215 @@
+import time
+
+
+class FrameAssembler:
+    """Rebuild frames from RTP packets by sequence number.
+
+    A frame is a run of consecutive sequence numbers that ends at a packet
+    with the marker bit set (or just before the timestamp changes).
+    Packets may arrive out of order within REORDER_WINDOW; a frame with a
+    missing packet is dropped once no progress has been made for MAX_DELAY
+    seconds or the window fills up. Sequence numbers are extended past the
+    16-bit wraparound, and jumps larger than MAX_DROPOUT (e.g. the server
+    restarting its numbering) resynchronise the assembler.
+
+    With maxAge set, no packet is held for more than that many further
+    push() calls, for payloads that are views into a reused receive ring.
+
+    Nothing here touches a socket: push() takes the packet fields and the
+    arrival time, so recorded packet traces can be replayed offline.
+    """
+    REORDER_WINDOW = 512     # packets buffered ahead of the oldest incomplete frame
+    MAX_DELAY = 0.2          # seconds to wait for a missing packet
+    MAX_DROPOUT = 3000       # forward jump treated as a restart (RFC 3550 A.1)
+    MAX_MISORDER = 100       # backward jump treated as a restart
+
+    def __init__(self, window=None, maxDelay=None, maxAge=None):
+        self.window = window or self.REORDER_WINDOW
+        self.maxDelay = self.MAX_DELAY if maxDelay is None else maxDelay
+        self.maxAge = maxAge
+        self.pushes = 0
+        self.counters = dict.fromkeys(('received', 'duplicates', 'reordered', 'late', 'lost',
+                                       'framesCompleted', 'framesDropped', 'resyncs'), 0)
+        self.reset()
+
+    def reset(self):
+        """Forget buffered packets; the next packet starts a new frame."""
+        self.packets = {}        # extended seq -> (timestamp, marker, payload, push number)
+        self.nextSeq = None      # extended seq the next frame starts at
+        self.highest = None      # highest extended seq received
+        self.stalledSince = None # arrival time of the gap holding up the next frame
+        self.started = False     # whether a frame has been emitted or dropped yet
+        self.oldestPush = None   # push number of the oldest packet held
+
+    def push(self, seq, timestamp, marker, payload, now=None):
+        """Add one packet; return the frames it completed as (timestamp, data)."""
+        if now is None:
+            now = time.monotonic()
+        counters = self.counters
+        counters['received'] += 1
+        self.pushes += 1
+        if self.highest is None:
+            ext = self.nextSeq = self.highest = seq
+        else:
+            ext = self.extend(seq)
+            delta = ext - self.highest
+            if delta > self.MAX_DROPOUT or ext < self.nextSeq - self.MAX_MISORDER:
+                counters['resyncs'] += 1
+                frames = self.flush()
+                self.stalledSince = None
+                ext = self.nextSeq = self.highest = seq
+                self.hold(ext, timestamp, marker, payload)
+                return frames + self.drain(now)
+            if ext < self.nextSeq:
+                if self.started:
+                    counters['late'] += 1
+                    return []
+                # the first packets of the stream arrived out of order
+                self.nextSeq = ext
+            if ext in self.packets:
+                counters['duplicates'] += 1
+                return []
+            if ext < self.highest:
+                counters['reordered'] += 1
+            else:
+                self.highest = ext
+        self.hold(ext, timestamp, marker, payload)
+        return self.drain(now)
+
+    def hold(self, ext, timestamp, marker, payload):
+        """Buffer a packet until its frame is complete."""
+        self.packets[ext] = (timestamp, marker, payload, self.pushes)
+        if self.oldestPush is None:
+            self.oldestPush = self.pushes
+
+    def extend(self, seq):
+        """Get the extended sequence number closest to the highest one received."""
+        delta = (seq - self.highest) & 0xFFFF
+        if delta >= 0x8000:
+            delta -= 0x10000
+        return self.highest + delta
+
+    def skipTo(self, seq):
+        """Make seq the start of the next frame and discard packets before it.
+
+        Used after a seek, with the first sequence number the server
+        announced for the new position (RTP-Info).
+        """
+        if self.highest is not None and abs(self.extend(seq) - self.highest) <= self.MAX_DROPOUT:
+            ext = self.extend(seq)
+            for key in [key for key in self.packets if key < ext]:
+                del self.packets[key]
+            self.nextSeq = max(self.nextSeq, ext)
+            self.highest = max(self.highest, ext - 1)
+        else:
+            self.packets.clear()
+            self.nextSeq = seq
+            self.highest = seq - 1
+        self.started = True
+        self.stalledSince = None
+        self.updateOldest()
+
+    def pushPacket(self, packet, now=None):
+        """Add a decoded RtpPacket."""
+        return self.push(packet.seqNum(), packet.timestamp(), packet.marker(), packet.getPayload(), now)
+
+    def drain(self, now):
+        """Emit the frames that are complete, dropping stalled ones."""
+        frames = []
+        while self.packets:
+            end, contiguous = self.frameEnd()
+            if end is not None:
+                frames.append(self.emit(end))
+                self.stalledSince = None
+                continue
+            if contiguous >= self.highest:
+                # no gap, the rest of the frame has not been sent yet
+                self.stalledSince = None
+                break
+            if self.maxAge is not None and self.pushes - self.oldestPush >= self.maxAge:
+                self.dropFrame()
+                continue
+            if self.stalledSince is None:
+                self.stalledSince = now
+            if now - self.stalledSince > self.maxDelay or self.highest - self.nextSeq >= self.window:
+                self.dropFrame()
+                self.stalledSince = now
+                continue
+            break
+        return frames
+
+    def flush(self):
+        """Emit what is complete and drop everything else (end of stream)."""
+        frames = []
+        while self.packets:
+            end, contiguous = self.frameEnd()
+            if end is not None:
+                frames.append(self.emit(end))
+            else:
+                self.dropFrame()
+        return frames
+
+    def frameEnd(self):
+        """Find the frame starting at nextSeq.
+
+        Returns (last seq of the frame or None if it is incomplete, last seq
+        of the run of packets received without a gap from nextSeq).
+        """
+        seq = self.nextSeq
+        first = self.packets.get(seq)
+        if first is None:
+            return None, seq - 1
+        timestamp = first[0]
+        while True:
+            packet = self.packets.get(seq)
+            if packet is None:
+                return None, seq - 1
+            if packet[0] != timestamp:
+                return seq - 1, seq - 1
+            if packet[1]:
+                return seq, seq
+            seq += 1
+
+    def emit(self, end):
+        """Join and remove the packets nextSeq..end as one frame."""
+        packets = self.packets
+        timestamp = packets[self.nextSeq][0]
+        data = b''.join([packets.pop(seq)[2] for seq in range(self.nextSeq, end + 1)])
+        self.nextSeq = end + 1
+        self.started = True
+        self.updateOldest()
+        self.counters['framesCompleted'] += 1
+        return timestamp, data
+
+    def dropFrame(self):
+        """Discard the incomplete frame at nextSeq, up to its marker or timestamp change."""
+        seqs = sorted(self.packets)
+        timestamp = self.packets[seqs[0]][0]
+        end = seqs[-1]
+        for seq in seqs:
+            packet = self.packets[seq]
+            if packet[0] != timestamp:
+                end = seq - 1
+                break
+            if packet[1]:
+                end = seq
+                break
+        present = 0
+        for seq in seqs:
+            if seq > end:
+                break
+            del self.packets[seq]
+            present += 1
+        self.counters['lost'] += end - self.nextSeq + 1 - present
+        self.counters['framesDropped'] += 1
+        self.nextSeq = end + 1
+        self.started = True
+        self.updateOldest()
+
+    def updateOldest(self):
+        """Find the push number of the oldest packet still held."""
+        self.oldestPush = min((packet[3] for packet in self.packets.values()), default=None)
+
+    def stats(self):
+        """Get a copy of the packet and frame counters."""
+        return dict(self.counters)
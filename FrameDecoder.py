@@ -0,0 +1,60 @@
+import os
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+class FrameDecoder:
+    """Decode JPEG frames in memory on a small thread pool, ahead of the playhead.
+
+    The renderer calls prefetch() with the frames it will show next and
+    get() for the frame it shows now; get() only waits if that frame's
+    decode has not finished yet. Frames are identified by a key (their
+    number in the frame arena). Both are meant to be called from the
+    render thread only.
+    """
+    WORKERS = min(2, os.cpu_count() or 1)
+    AHEAD = 4                # frames decoded ahead of the playhead
+
+    def __init__(self, workers=None, ahead=None):
+        self.ahead = ahead or self.AHEAD
+        self.pool = ThreadPoolExecutor(max_workers=workers or self.WORKERS,
+                                       thread_name_prefix="jpeg-decode")
+        self.pending = {}        # frame key -> decode future
+
+    @staticmethod
+    def decode(data):
+        """Decode one JPEG frame from memory into an RGB image."""
+        image = Image.open(BytesIO(data))
+        image.load()
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return image
+
+    def prefetch(self, frames):
+        """Start decoding the upcoming (key, frame) pairs; forget decodes no longer upcoming."""
+        upcoming = {}
+        for key, frame in frames[:self.ahead]:
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pool.submit(self.decode, frame)
+            upcoming[key] = future
+        for key, future in self.pending.items():
+            if key not in upcoming:
+                future.cancel()
+        self.pending = upcoming
+
+    def get(self, key, frame):
+        """Get the decoded image of a frame, or None if it is not a valid JPEG."""
+        future = self.pending.pop(key, None)
+        try:
+            if future is not None:
+                return future.result()
+            return self.decode(frame)
+        except Exception:
+            return None
+
+    def close(self):
+        """Stop the decode threads, dropping queued work."""
+        self.pool.shutdown(wait=False, cancel_futures=True)
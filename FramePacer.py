@@ -0,0 +1,51 @@
+from time import monotonic
+
+class FramePacer:
+	"""Schedule frames against absolute deadlines of a fixed-rate media clock.
+
+	Deadlines are computed from the frame number, never from the previous
+	send, so processing time does not accumulate as drift.
+	"""
+	# fraction of the frame interval a frame's packets are spread over
+	SPREAD = 0.75
+	# packets sent back to back per burst
+	BURST = 8
+	# frames the sender may fall behind before it skips instead of catching up
+	MAX_LAG = 3
+
+	def __init__(self, frameRate, clock=monotonic):
+		self.interval = 1.0 / frameRate
+		self.clock = clock
+		self.reset(0)
+
+	def reset(self, frame, now=None):
+		"""Anchor the clock so that `frame` is due now."""
+		if now is None:
+			now = self.clock()
+		self.origin = now - frame * self.interval
+
+	def deadline(self, frame):
+		"""Get the time `frame` is due."""
+		return self.origin + frame * self.interval
+
+	def position(self, now):
+		"""Get the media position at `now`, in frames (fractional between two frames)."""
+		return (now - self.origin) / self.interval
+
+	def catchUp(self, frame, now):
+		"""Get the frame to send at `now`: `frame` itself, or the frame due now
+		if the sender has fallen more than MAX_LAG frames behind."""
+		if now - self.deadline(frame) > self.MAX_LAG * self.interval:
+			return int((now - self.origin) / self.interval)
+		return frame
+
+	def bursts(self, frame, count):
+		"""Split `count` packets of `frame` into bursts spread over the interval.
+
+		Yields (start, end, deadline) for packets[start:end].
+		"""
+		bursts = (count + self.BURST - 1) // self.BURST
+		step = self.interval * self.SPREAD / bursts if bursts else 0
+		due = self.deadline(frame)
+		for i in range(bursts):
+			yield i * self.BURST, min(count, (i + 1) * self.BURST), due + i * step
@@ -0,0 +1,128 @@
+import os
+import time
+import threading
+
+from ClientSession import ClientSession
+
+
+class FrameSink:
+    """Where a headless client's frames go; this one throws them away."""
+
+    def write(self, number, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class DirectorySink(FrameSink):
+    """Write each frame to its own JPEG file in a directory."""
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, number, data):
+        with open(os.path.join(self.path, f"frame{number:06d}.jpg"), 'wb') as f:
+            f.write(data)
+
+
+class StreamSink(FrameSink):
+    """Write frames back to back to a binary stream: an MJPEG stream (e.g. for ffplay -f mjpeg -)."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, number, data):
+        self.stream.write(data)
+
+    def close(self):
+        try:
+            self.stream.flush()
+        except OSError:
+            pass
+
+
+class HeadlessClient(ClientSession):
+    """A client session without a window: frames go to a sink as soon as they are complete.
+
+    Frames are not paced or kept for rewind, so the session runs at
+    whatever rate the server and network deliver. Throughput and loss
+    are printed once a second.
+    """
+    SETUP_TIMEOUT = 5.0      # seconds to wait for the SETUP reply
+    IDLE_TIMEOUT = 3.0       # seconds without a frame after which the stream has ended
+    REPORT_INTERVAL = 1.0
+
+    def __init__(self, serveraddr, serverport, rtpport, filename, sink=None):
+        self.sink = sink or FrameSink()
+        self.framesReceived = 0
+        self.bytesReceived = 0
+        self.lastFrameTime = None
+        self.stopped = threading.Event()
+        super().__init__(serveraddr, serverport, rtpport, filename)
+
+    def setStatus(self, text, color="blue"):
+        print(f"Status: {text}")
+
+    def frameReceived(self, frameData, timestamp):
+        try:
+            self.sink.write(self.framesReceived, frameData)
+        except OSError as e:
+            # disk full, or the reader of the pipe went away
+            print(f"Cannot write frame: {e}")
+            self.stopped.set()
+            return
+        self.framesReceived += 1
+        self.bytesReceived += len(frameData)
+        self.lastFrameTime = time.monotonic()
+
+    def clearBuffer(self):
+        # nothing is buffered
+        pass
+
+    def run(self, duration=None):
+        """Set up, play until the duration is up or the stream ends, tear down; return an exit status."""
+        self.setupMovie()
+        deadline = time.monotonic() + self.SETUP_TIMEOUT
+        while self.state != self.READY and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if self.state != self.READY:
+            print("No reply to SETUP")
+            self.close()
+            return 1
+
+        self.playMovie()
+        start = last = time.monotonic()
+        lastCounts = (0, 0, 0, 0)
+        try:
+            while not self.stopped.wait(self.REPORT_INTERVAL):
+                now = time.monotonic()
+                counts = (self.framesReceived, self.bytesReceived) + self.packetCounts()
+                self.report(now - start, now - last, [a - b for a, b in zip(counts, lastCounts)])
+                last, lastCounts = now, counts
+                if duration is not None and now - start >= duration:
+                    break
+                if now - (self.lastFrameTime or start) > self.IDLE_TIMEOUT:
+                    print("Stream ended")
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+            self.sink.close()
+
+        elapsed = time.monotonic() - start
+        received, lost = self.packetCounts()
+        print(f"Total: {self.framesReceived} frames, {self.bytesReceived / 1e6:.1f} MB in {elapsed:.1f} s, "
+              f"{self.bytesReceived * 8 / elapsed / 1e6:.2f} Mbit/s, "
+              f"lost {lost} of {received + lost} packets")
+        return 0
+
+    def report(self, elapsed, interval, counts):
+        frames, size, received, lost = counts
+        total = received + lost
+        jitter = self.rtcpStats().get('jitter', 0.0)
+        print(f"{elapsed:6.1f} s  {frames / interval:5.1f} fps  {size * 8 / interval / 1e6:7.2f} Mbit/s  "
+              f"loss {lost / total * 100 if total else 0.0:5.2f}% ({lost}/{total} packets)  "
+              f"jitter {jitter * 1000:5.1f} ms")
@@ -0,0 +1,461 @@
+import sys, os, time, json, argparse, asyncio, socket, subprocess, shlex, tempfile, statistics, platform
+
+from Benchmark import writeSyntheticMjpeg
+from RtpPacket import RTP_HEADER, HEADER_SIZE
+from RtcpPacket import ReceptionStats
+from RtspParser import RtspParser, RtspMessage
+
+RTP_CLOCK_RATE = 90000
+
+def percentile(values, q):
+	"""Get the q-th percentile (0..100) of values by nearest rank; None if there are none."""
+	if not values:
+		return None
+	values = sorted(values)
+	return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+def summarize(values):
+	"""Mean, median, 95th percentile and maximum of a list of numbers."""
+	if not values:
+		return None
+	return {'mean': statistics.fmean(values), 'p50': percentile(values, 50),
+		'p95': percentile(values, 95), 'max': max(values)}
+
+class RtpCounter(asyncio.DatagramProtocol):
+	"""Count one session's RTP packets, payload bytes and frame arrivals, without keeping the data."""
+
+	def __init__(self):
+		self.reception = ReceptionStats(RTP_CLOCK_RATE)
+		self.received = 0
+		self.lost = 0
+		self.bytes = 0
+		self.frames = 0
+		self.intervals = []         # seconds between the last packets of consecutive frames
+		self.lastFrame = None
+		self.firstPacket = None
+
+	def restart(self):
+		"""Start a new play period: the server numbers packets from zero again after a PAUSE."""
+		self.received += self.reception.received
+		self.lost += max(0, self.reception.expected() - self.reception.received)
+		self.reception = ReceptionStats(RTP_CLOCK_RATE)
+		self.lastFrame = None
+		self.firstPacket = None
+
+	def datagram_received(self, data, address):
+		now = time.monotonic()
+		if len(data) < HEADER_SIZE:
+			return
+		first, second, seq, timestamp, ssrc = RTP_HEADER.unpack_from(data)
+		if first >> 6 != 2:
+			return
+		if self.firstPacket is None:
+			self.firstPacket = now
+		self.reception.update(ssrc, seq, timestamp, now)
+		self.bytes += len(data) - HEADER_SIZE
+		if second & 0x80:
+			self.frames += 1
+			if self.lastFrame is not None:
+				self.intervals.append(now - self.lastFrame)
+			self.lastFrame = now
+
+	def error_received(self, exc):
+		pass
+
+	def totals(self):
+		"""Get (received, lost) packets over every play period so far."""
+		return (self.received + self.reception.received,
+			self.lost + max(0, self.reception.expected() - self.reception.received))
+
+class LoadSession:
+	"""One headless RTSP client session: SETUP, PLAY, PAUSE and TEARDOWN over asyncio.
+
+	Requests are sent one at a time, in the same format as Client, and
+	RTP is counted by an RtpCounter on the session's client port.
+	"""
+	REPLY_TIMEOUT = 5.0
+	RTP_RCVBUF = 4 << 20
+
+	def __init__(self, host, port, filename, rtpPort):
+		self.host = host
+		self.port = port
+		self.filename = filename
+		self.rtpPort = rtpPort
+		self.cseq = 0
+		self.session = 0
+		self.timeout = None         # session timeout the server announced
+		self.reader = None
+		self.writer = None
+		self.transport = None
+		self.counter = RtpCounter()
+		self.parser = RtspParser()
+		self.setupLatency = None
+		self.startupLatencies = []  # PLAY sent -> first RTP packet, per play period
+		self.playTime = 0.0
+		self.playStart = None
+		self.error = None
+
+	async def open(self):
+		"""Connect the RTSP connection and bind the RTP port."""
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		try:
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RTP_RCVBUF)
+		except OSError:
+			pass
+		sock.bind(('', self.rtpPort))
+		loop = asyncio.get_running_loop()
+		self.transport, _ = await loop.create_datagram_endpoint(lambda: self.counter, sock=sock)
+		self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+	async def request(self, method):
+		"""Send one request and wait for its reply; return the reply's status code."""
+		self.cseq += 1
+		request = RtspMessage.request(method, self.filename, [('CSeq', self.cseq)])
+		if method == 'SETUP':
+			request.set('Transport', f"RTP/UDP;client_port={self.rtpPort}")
+		else:
+			request.set('Session', self.session)
+		self.writer.write(request.encode())
+		await self.writer.drain()
+		return await asyncio.wait_for(self.readReply(self.cseq), self.REPLY_TIMEOUT)
+
+	async def readReply(self, cseq):
+		"""Read until the reply with CSeq cseq arrives; return its status code."""
+		while True:
+			data = await self.reader.read(4096)
+			if not data:
+				raise ConnectionError("server closed the RTSP connection")
+			for reply in self.parser.feed(data):
+				if reply.cseq != cseq:
+					continue
+				session, *fields = reply.get('session', '').split(';')
+				if self.session == 0 and session.isdigit():
+					self.session = int(session)
+				for field in fields:
+					name, _, value = field.partition('=')
+					if name.strip().lower() == 'timeout' and value.strip().isdigit():
+						self.timeout = int(value)
+				return reply.statusCode
+
+	async def setup(self):
+		start = time.perf_counter()
+		code = await self.request('SETUP')
+		self.setupLatency = time.perf_counter() - start
+		if code != 200:
+			raise ConnectionError(f"SETUP failed with {code}")
+
+	async def play(self):
+		self.counter.restart()
+		start = time.monotonic()
+		code = await self.request('PLAY')
+		if code != 200:
+			raise ConnectionError(f"PLAY failed with {code}")
+		self.playStart = start
+
+	async def pause(self):
+		await self.request('PAUSE')
+		self.stopPlaying()
+
+	async def hold(self, until):
+		"""Wait until a monotonic time, sending GET_PARAMETER keep-alives as the session timeout requires."""
+		while True:
+			wait = until - time.monotonic()
+			if self.timeout:
+				wait = min(wait, self.timeout / 2)
+			if wait <= 0:
+				return
+			await asyncio.sleep(wait)
+			if self.timeout and time.monotonic() < until:
+				await self.request('GET_PARAMETER')
+
+	async def teardown(self):
+		try:
+			await self.request('TEARDOWN')
+		finally:
+			self.stopPlaying()
+
+	def stopPlaying(self):
+		"""Close the current play period."""
+		if self.playStart is None:
+			return
+		now = time.monotonic()
+		self.playTime += now - self.playStart
+		if self.counter.firstPacket is not None:
+			self.startupLatencies.append(self.counter.firstPacket - self.playStart)
+		self.playStart = None
+
+	def close(self):
+		self.stopPlaying()
+		if self.writer is not None:
+			self.writer.close()
+		if self.transport is not None:
+			self.transport.close()
+
+	def result(self):
+		"""Per-session statistics for the report."""
+		counter = self.counter
+		received, lost = counter.totals()
+		intervals = counter.intervals
+		return {
+			'rtpPort': self.rtpPort,
+			'error': self.error,
+			'setupLatency': self.setupLatency,
+			'startupLatency': summarize(self.startupLatencies),
+			'playSeconds': self.playTime,
+			'frames': counter.frames,
+			'bytes': counter.bytes,
+			'packetsReceived': received,
+			'packetsLost': lost,
+			'lossRatio': lost / (received + lost) if received + lost else 0.0,
+			'frameInterval': summarize(intervals),
+			'frameIntervalJitter': statistics.pstdev(intervals) if len(intervals) > 1 else None,
+			'interarrivalJitter': counter.reception.jitter / RTP_CLOCK_RATE,
+		}
+
+class ProcessMonitor:
+	"""CPU time and resident memory of a process and its children, read from /proc (Linux)."""
+
+	def __init__(self, pid):
+		self.pid = pid
+		self.samples = []           # (monotonic time, CPU seconds, RSS bytes)
+		self.ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+	@staticmethod
+	def available():
+		return os.path.isdir('/proc/self/task')
+
+	def pids(self):
+		"""The process and its descendants (the workers of Server --workers)."""
+		pids = [self.pid]
+		for pid in pids:
+			try:
+				for task in os.listdir(f'/proc/{pid}/task'):
+					with open(f'/proc/{pid}/task/{task}/children') as f:
+						pids.extend(int(child) for child in f.read().split())
+			except OSError:
+				continue
+		return pids
+
+	def sample(self):
+		cpu = 0.0
+		rss = 0
+		for pid in self.pids():
+			try:
+				with open(f'/proc/{pid}/stat') as f:
+					# fields after the command name; utime and stime are fields 14 and 15
+					fields = f.read().rsplit(')', 1)[1].split()
+				cpu += (int(fields[11]) + int(fields[12])) / self.ticks
+				with open(f'/proc/{pid}/status') as f:
+					for line in f:
+						if line.startswith('VmRSS:'):
+							rss += int(line.split()[1]) * 1024
+							break
+			except (OSError, IndexError, ValueError):
+				continue
+		self.samples.append((time.monotonic(), cpu, rss))
+
+	async def run(self, interval=1.0):
+		while True:
+			self.sample()
+			await asyncio.sleep(interval)
+
+	def result(self):
+		if len(self.samples) < 2:
+			return None
+		(start, cpuStart, _), (end, cpuEnd, rssEnd) = self.samples[0], self.samples[-1]
+		return {
+			'pid': self.pid,
+			'cpuSeconds': cpuEnd - cpuStart,
+			'cpuPercent': 100 * (cpuEnd - cpuStart) / (end - start) if end > start else None,
+			'rssPeakBytes': max(rss for _, _, rss in self.samples),
+			'rssEndBytes': rssEnd,
+		}
+
+class LoadTest:
+	"""Run N synthetic clients against a server and report how it held up."""
+	SCENARIOS = ('steady', 'pause', 'churn')
+
+	def __init__(self, args, filename):
+		self.args = args
+		self.filename = filename
+		self.sessions = []
+
+	async def runClient(self, index, deadline):
+		"""Drive one client through the scenario until the deadline."""
+		args = self.args
+		await asyncio.sleep(args.ramp * index / max(1, args.clients))
+		rtpPort = args.rtp_base + 2 * index     # RTCP goes to the port above
+		while time.monotonic() < deadline:
+			session = LoadSession(args.host, args.port, self.filename, rtpPort)
+			self.sessions.append(session)
+			try:
+				await session.open()
+				await session.setup()
+				await session.play()
+				if args.scenario == 'steady':
+					await session.hold(deadline)
+				elif args.scenario == 'pause':
+					playing = True
+					while time.monotonic() + args.cycle < deadline:
+						await session.hold(time.monotonic() + args.cycle)
+						await (session.pause() if playing else session.play())
+						playing = not playing
+					await session.hold(deadline)
+				else:
+					await asyncio.sleep(max(0.0, min(args.cycle, deadline - time.monotonic())))
+				await session.teardown()
+			except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+				session.error = str(e) or type(e).__name__
+			finally:
+				session.close()
+			if args.scenario != 'churn' or session.error:
+				break
+			# the server sends its last packets after the TEARDOWN reply
+			await asyncio.sleep(0.05)
+
+	async def run(self, monitor):
+		args = self.args
+		start = time.monotonic()
+		deadline = start + args.ramp + args.duration
+		monitorTask = asyncio.ensure_future(monitor.run()) if monitor else None
+		try:
+			await asyncio.gather(*(self.runClient(i, deadline) for i in range(args.clients)))
+		finally:
+			if monitorTask is not None:
+				monitorTask.cancel()
+				monitor.sample()
+		return time.monotonic() - start
+
+	def report(self, elapsed, monitor):
+		"""Build the JSON report."""
+		args = self.args
+		sessions = [session.result() for session in self.sessions]
+		ok = [s for s in sessions if s['error'] is None]
+		totalBytes = sum(s['bytes'] for s in sessions)
+		received = sum(s['packetsReceived'] for s in sessions)
+		lost = sum(s['packetsLost'] for s in sessions)
+		return {
+			'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+			'host': platform.node(),
+			'python': platform.python_version(),
+			'config': {name: value for name, value in vars(args).items()},
+			'elapsedSeconds': elapsed,
+			'aggregate': {
+				'sessions': len(sessions),
+				'failedSessions': len(sessions) - len(ok),
+				'throughputMbps': totalBytes * 8 / elapsed / 1e6,
+				'framesPerSecond': sum(s['frames'] for s in sessions) / elapsed,
+				'packetsReceived': received,
+				'packetsLost': lost,
+				'lossRatio': lost / (received + lost) if received + lost else 0.0,
+				'setupLatency': summarize([s['setupLatency'] for s in sessions if s['setupLatency'] is not None]),
+				'startupLatency': summarize([s['startupLatency']['mean'] for s in ok if s['startupLatency']]),
+				'frameIntervalJitter': summarize([s['frameIntervalJitter'] for s in ok if s['frameIntervalJitter'] is not None]),
+			},
+			'server': monitor.result() if monitor else None,
+			'sessions': sessions,
+		}
+
+def freePort():
+	"""Get a TCP port nothing listens on right now."""
+	with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+def startServer(args):
+	"""Start Server.py on a free port; return the process once it accepts connections."""
+	args.port = freePort()
+	command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Server.py'),
+		str(args.port), '--fps', str(args.fps), '--log-level', 'warning'] + shlex.split(args.server_args)
+	server = subprocess.Popen(command)
+	deadline = time.monotonic() + 10
+	while time.monotonic() < deadline:
+		if server.poll() is not None:
+			raise RuntimeError(f"server exited with status {server.returncode}")
+		try:
+			socket.create_connection((args.host, args.port), timeout=0.5).close()
+			return server
+		except OSError:
+			time.sleep(0.1)
+	server.kill()
+	raise RuntimeError("server did not start listening")
+
+def stopServer(server):
+	"""Stop a server started by startServer the way Ctrl+C does."""
+	server.send_signal(2)
+	try:
+		server.wait(10)
+	except subprocess.TimeoutExpired:
+		server.kill()
+		server.wait()
+
+def printSummary(report):
+	aggregate = report['aggregate']
+	print(f"{aggregate['sessions']} sessions ({aggregate['failedSessions']} failed) in {report['elapsedSeconds']:.1f} s: "
+		f"{aggregate['throughputMbps']:.1f} Mbit/s, {aggregate['framesPerSecond']:.0f} frames/s, "
+		f"loss {aggregate['lossRatio'] * 100:.2f}%")
+	for name in ('setupLatency', 'startupLatency', 'frameIntervalJitter'):
+		summary = aggregate[name]
+		if summary:
+			print(f"{name:<20} mean {summary['mean'] * 1000:8.2f} ms  p95 {summary['p95'] * 1000:8.2f} ms  max {summary['max'] * 1000:8.2f} ms")
+	server = report['server']
+	if server:
+		print(f"server pid {server['pid']}: CPU {server['cpuPercent']:.0f}% ({server['cpuSeconds']:.1f} s), "
+			f"RSS peak {server['rssPeakBytes'] / 1e6:.1f} MB")
+
+def main():
+	parser = argparse.ArgumentParser(description="Load test: N headless RTSP/RTP clients against a local server.")
+	parser.add_argument('clients', type=int, help="number of concurrent clients")
+	parser.add_argument('--scenario', choices=LoadTest.SCENARIOS, default='steady',
+		help="steady: play throughout; pause: toggle PAUSE/PLAY every --cycle seconds; "
+			"churn: a new session (SETUP, PLAY, TEARDOWN) every --cycle seconds")
+	parser.add_argument('--duration', type=float, default=10.0, help="seconds to run after the last client started")
+	parser.add_argument('--ramp', type=float, default=1.0, help="seconds over which the clients start")
+	parser.add_argument('--cycle', type=float, default=2.0, help="seconds per pause/play or churn cycle")
+	parser.add_argument('--file', help="video to request (default: a synthetic MJPEG)")
+	parser.add_argument('--resolution', default='640x480', help="WIDTHxHEIGHT of the synthetic video")
+	parser.add_argument('--bitrate', type=float, default=2000, help="kbit/s of the synthetic video")
+	parser.add_argument('--fps', type=float, default=20, help="frame rate to stream at")
+	parser.add_argument('--frames', type=int, default=600, help="frames in the synthetic video")
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, help="RTSP port of a running server (default: start Server.py)")
+	parser.add_argument('--server-pid', type=int, help="process to sample CPU and memory of, with --port")
+	parser.add_argument('--server-args', default='', help="extra Server.py options, e.g. \"--engine asyncio\"")
+	parser.add_argument('--rtp-base', type=int, default=40000, help="RTP port of the first client; each takes two")
+	parser.add_argument('--output', default='loadtest.json', help="JSON report file")
+	args = parser.parse_args()
+
+	tmp = None
+	filename = args.file and os.path.abspath(args.file)
+	if filename is None:
+		width, height = (int(n) for n in args.resolution.lower().split('x'))
+		frameSize = max(1000, int(args.bitrate * 1000 / 8 / args.fps))
+		tmp = tempfile.NamedTemporaryFile(suffix='.Mjpeg', delete=False)
+		tmp.close()
+		filename = tmp.name
+		writeSyntheticMjpeg(filename, args.frames, frameSize, dimensions=(width, height))
+
+	server = None
+	try:
+		if args.port is None:
+			server = startServer(args)
+			args.server_pid = server.pid
+		monitor = ProcessMonitor(args.server_pid) if args.server_pid and ProcessMonitor.available() else None
+		test = LoadTest(args, filename)
+		elapsed = asyncio.run(test.run(monitor))
+		report = test.report(elapsed, monitor)
+	finally:
+		if server is not None:
+			stopServer(server)
+		if tmp is not None:
+			for path in (filename, filename + '.idx'):
+				if os.path.exists(path):
+					os.remove(path)
+
+	with open(args.output, 'w') as f:
+		json.dump(report, f, indent=2)
+	printSummary(report)
+	print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,219 @@
+import threading, logging
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+log = logging.getLogger(__name__)
+
+# upper bounds (seconds) of the latency histogram buckets, 10 us to 100 ms
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1)
+
+class Counter:
+	"""A value that only goes up."""
+
+	def __init__(self):
+		self.value = 0
+		self.lock = threading.Lock()
+
+	def inc(self, amount=1):
+		"""Add amount to the value."""
+		with self.lock:
+			self.value += amount
+
+	def sample(self):
+		"""Get the current value."""
+		return self.value
+
+class Gauge(Counter):
+	"""A value that goes up and down."""
+
+	def dec(self, amount=1):
+		"""Subtract amount from the value."""
+		with self.lock:
+			self.value -= amount
+
+	def set(self, value):
+		"""Replace the value."""
+		self.value = value
+
+class Histogram:
+	"""Counts of observed values per bucket, with their sum (Prometheus histogram)."""
+
+	def __init__(self, buckets):
+		self.buckets = tuple(buckets)
+		self.counts = [0] * (len(self.buckets) + 1)    # last one is +Inf
+		self.sum = 0.0
+		self.lock = threading.Lock()
+
+	def observe(self, value):
+		"""Count one value in the first bucket whose bound is not below it."""
+		i = bisect_left(self.buckets, value)
+		with self.lock:
+			self.counts[i] += 1
+			self.sum += value
+
+	def sample(self):
+		"""Get the bucket counts (not cumulative) and the sum."""
+		with self.lock:
+			return {'counts': list(self.counts), 'sum': self.sum}
+
+class Metrics:
+	"""Registry of the process's counters, gauges and histograms.
+
+	A snapshot is a JSON-able dict: name -> {'type', 'help', 'samples'},
+	samples mapping a label string ('' for none, 'session="123"') to a
+	number, or for histograms to bucket counts and their sum (bucket
+	bounds in 'buckets'). Server --workers adds up the snapshots of its
+	worker processes with merge() and serves the total. Collectors add
+	samples computed at scrape time, such as per-session values.
+	"""
+	PREFIX = 'rtsp_'
+
+	_shared = None
+	_sharedLock = threading.Lock()
+
+	@classmethod
+	def shared(cls):
+		"""Get the process-wide registry."""
+		with cls._sharedLock:
+			if cls._shared is None:
+				cls._shared = cls()
+			return cls._shared
+
+	def __init__(self):
+		self.metrics = {}       # name -> (type, help, metric)
+		self.collectors = []
+		self.lock = threading.Lock()
+
+	def register(self, kind, name, help, metric):
+		"""Add a metric under name, or get the one already there."""
+		with self.lock:
+			if name not in self.metrics:
+				self.metrics[name] = (kind, help, metric)
+			return self.metrics[name][2]
+
+	def counter(self, name, help):
+		"""Get the counter called name, creating it on first use."""
+		return self.register('counter', name, help, Counter())
+
+	def gauge(self, name, help):
+		"""Get the gauge called name, creating it on first use."""
+		return self.register('gauge', name, help, Gauge())
+
+	def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+		"""Get the histogram called name, creating it on first use."""
+		return self.register('histogram', name, help, Histogram(buckets))
+
+	def collect(self, collector):
+		"""Call collector(add) at every snapshot; it calls add(kind, name, help, labels, value)."""
+		self.collectors.append(collector)
+
+	def snapshot(self):
+		"""Get the current value of every metric."""
+		with self.lock:
+			metrics = list(self.metrics.items())
+		snapshot = {}
+		for name, (kind, help, metric) in metrics:
+			entry = snapshot[name] = {'type': kind, 'help': help, 'samples': {'': metric.sample()}}
+			if kind == 'histogram':
+				entry['buckets'] = list(metric.buckets)
+
+		def add(kind, name, help, labels, value):
+			entry = snapshot.setdefault(name, {'type': kind, 'help': help, 'samples': {}})
+			entry['samples'][labels] = value
+
+		for collector in self.collectors:
+			try:
+				collector(add)
+			except Exception:
+				log.exception("Metrics collector failed")
+		return snapshot
+
+	@staticmethod
+	def merge(snapshots, retired=False):
+		"""Add snapshots up.
+
+		With retired set, only what outlives a worker process is kept:
+		counters and histograms, without per-session samples.
+		"""
+		total = {}
+		for snapshot in snapshots:
+			for name, entry in snapshot.items():
+				if retired and entry['type'] == 'gauge':
+					continue
+				merged = total.setdefault(name, dict(entry, samples={}))
+				for labels, value in entry['samples'].items():
+					if retired and labels:
+						continue
+					old = merged['samples'].get(labels)
+					if old is None:
+						merged['samples'][labels] = value
+					elif isinstance(value, dict):
+						merged['samples'][labels] = {'counts': [a + b for a, b in zip(old['counts'], value['counts'])],
+							'sum': old['sum'] + value['sum']}
+					else:
+						merged['samples'][labels] = old + value
+		return total
+
+	@classmethod
+	def render(cls, snapshot):
+		"""Format a snapshot in the Prometheus text exposition format."""
+		lines = []
+		for name, entry in sorted(snapshot.items()):
+			if not entry['samples']:
+				continue
+			full = cls.PREFIX + name
+			lines.append(f"# HELP {full} {entry['help']}")
+			lines.append(f"# TYPE {full} {entry['type']}")
+			for labels, value in sorted(entry['samples'].items()):
+				if entry['type'] != 'histogram':
+					lines.append(f"{full}{{{labels}}} {value}" if labels else f"{full} {value}")
+					continue
+				sep = labels + ',' if labels else ''
+				count = 0
+				for bound, bucketCount in zip(entry['buckets'] + ['+Inf'], value['counts']):
+					count += bucketCount
+					lines.append(f'{full}_bucket{{{sep}le="{bound}"}} {count}')
+				suffix = f"{{{labels}}}" if labels else ''
+				lines.append(f"{full}_sum{suffix} {value['sum']}")
+				lines.append(f"{full}_count{suffix} {count}")
+		return '\n'.join(lines) + '\n'
+
+	@staticmethod
+	def totals(snapshot):
+		"""Get name -> value of the unlabelled counters and gauges, for a one-line summary."""
+		return {name: entry['samples'][''] for name, entry in snapshot.items()
+			if entry['type'] != 'histogram' and '' in entry['samples']}
+
+class MetricsServer:
+	"""Serve a snapshot source at /metrics over HTTP from a background thread."""
+
+	def __init__(self, port, snapshot, host='127.0.0.1'):
+		self.snapshot = snapshot
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(handler):
+				if handler.path.split('?', 1)[0] != '/metrics':
+					handler.send_error(404)
+					return
+				body = Metrics.render(self.snapshot()).encode()
+				handler.send_response(200)
+				handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+				handler.send_header('Content-Length', str(len(body)))
+				handler.end_headers()
+				handler.wfile.write(body)
+
+			def log_message(handler, format, *args):
+				log.debug("metrics %s " + format, handler.address_string(), *args)
+
+		self.httpd = ThreadingHTTPServer((host, port), Handler)
+		self.httpd.daemon_threads = True
+
+	def start(self):
+		"""Start serving in a daemon thread."""
+		threading.Thread(target=self.httpd.serve_forever, name="metrics-http", daemon=True).start()
+		log.info("Metrics at http://%s:%d/metrics", *self.httpd.server_address[:2])
+
+	def close(self):
+		"""Stop serving and close the port."""
+		self.httpd.shutdown()
+		self.httpd.server_close()
@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+class PacketCache:
+	"""Frames of media files already cut into RTP payloads, shared by all sessions.
+
+	An entry maps (media file key, frame, payload size) to the frame's
+	(payload, marker) fragments, so a session playing a hot file only packs
+	its own 12-byte headers. Payloads are the frame's own buffers: slices
+	of the shared memory map, or the bytes read from the file. Entries past
+	BUDGET bytes are evicted least recently used.
+	"""
+	# bytes of frame data kept; 0 disables the cache
+	BUDGET = 64 << 20
+	# rough per-fragment cost of the memoryview and tuple objects
+	FRAGMENT_OVERHEAD = 200
+
+	_shared = None
+	_sharedLock = threading.Lock()
+
+	@classmethod
+	def shared(cls):
+		"""Get the process-wide cache, creating it on first use."""
+		with cls._sharedLock:
+			if cls._shared is None:
+				cls._shared = cls(cls.BUDGET)
+			return cls._shared
+
+	@classmethod
+	def discardShared(cls, fileKey):
+		"""Drop a media file's entries from the process-wide cache, if there is one."""
+		if cls._shared is not None:
+			cls._shared.discard(fileKey)
+
+	def __init__(self, budget):
+		self.budget = budget
+		self.size = 0
+		self.entries = OrderedDict()    # (fileKey, frame, payloadSize) -> (fragments, cost)
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		"""Get the fragments cached under key, or None."""
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None:
+				return None
+			self.entries.move_to_end(key)
+			return entry[0]
+
+	def put(self, key, fragments):
+		"""Cache a frame's fragments, evicting older frames to stay within budget."""
+		cost = sum(len(payload) for payload, marker in fragments) + self.FRAGMENT_OVERHEAD * len(fragments)
+		if cost > self.budget:
+			return
+		with self.lock:
+			old = self.entries.pop(key, None)
+			if old is not None:
+				self.size -= old[1]
+			self.entries[key] = (fragments, cost)
+			self.size += cost
+			while self.size > self.budget:
+				_, (_, evicted) = self.entries.popitem(last=False)
+				self.size -= evicted
+
+	def discard(self, fileKey):
+		"""Drop every entry of one media file (before its mapping is closed)."""
+		with self.lock:
+			for key in [key for key in self.entries if key[0] == fileKey]:
+				self.size -= self.entries.pop(key)[1]
+
+	@staticmethod
+	def fragment(data, payloadSize):
+		"""Cut a frame into (payload, marker) pairs; only the last has the marker set."""
+		view = memoryview(data)
+		size = len(view)
+		return tuple((view[offset:offset + payloadSize], 1 if offset + payloadSize >= size else 0)
+			for offset in range(0, size, payloadSize))
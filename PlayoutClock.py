@@ -0,0 +1,88 @@
+import math
+
+
+class PlayoutClock:
+    """Map RTP timestamps to the local times their frames are due on screen.
+
+    The clock is anchored on a frame: that frame is due when it is
+    anchored, and every other frame (its timestamp - the anchor's) / the
+    clock rate seconds later. Frames therefore keep the spacing the
+    sender gave them however the network bunches them up, and a late
+    frame is shown at once so playback catches up instead of drifting.
+    A frame due further off than MAX_EARLY/MAX_LATE means the stream
+    jumped (seek, rewind, pause, a long stall); the clock anchors on it
+    afresh. A live player passes a small maxLate instead: a late frame then
+    becomes the new anchor, and the playout delay grows to what the
+    network needs.
+
+    The clock also measures how unevenly frames arrive: the interarrival
+    jitter of whole frames (RFC 3550 A.8, on frame completion times) and
+    the frame interval. targetDelay() is the playout delay that jitter
+    calls for.
+    """
+    MAX_EARLY = 1.0     # seconds ahead a frame may be due before the clock re-anchors
+    MAX_LATE = 0.5      # seconds behind a frame may be before the clock re-anchors
+    LIVE_MAX_LATE = 0.01
+    JITTER_FACTOR = 4   # jitters of delay on top of one frame interval
+    FRAME_INTERVAL = 0.05  # frame interval assumed until two frames have arrived
+
+    def __init__(self, clockRate=90000, maxLate=None):
+        self.clockRate = clockRate
+        self.maxLate = self.MAX_LATE if maxLate is None else maxLate
+        self.anchorTimestamp = None
+        self.anchorTime = None
+        self.jitter = 0.0               # seconds
+        self.frameInterval = None       # seconds, smoothed
+        self.lastArrival = None         # (timestamp, local time) of the latest frame
+
+    def reset(self):
+        """Anchor on the next frame asked about."""
+        self.anchorTimestamp = None
+        self.anchorTime = None
+
+    def anchor(self, timestamp, now):
+        """Make the frame with this timestamp due at now."""
+        self.anchorTimestamp = timestamp
+        self.anchorTime = now
+
+    def offset(self, timestamp, reference=None):
+        """Get the seconds from the anchor frame (or reference timestamp) to this one (32-bit timestamps wrap)."""
+        if reference is None:
+            reference = self.anchorTimestamp
+        ticks = (timestamp - reference + (1 << 31)) % (1 << 32) - (1 << 31)
+        return ticks / self.clockRate
+
+    def arrived(self, timestamp, now):
+        """Update the jitter and frame interval with a frame completed at local time now."""
+        if self.lastArrival is not None:
+            lastTimestamp, lastTime = self.lastArrival
+            media = self.offset(timestamp, lastTimestamp)
+            if 0 < media < self.MAX_EARLY:
+                # a seek or restart in between says nothing about the network
+                self.jitter += (abs(now - lastTime - media) - self.jitter) / 16
+                if self.frameInterval is None:
+                    self.frameInterval = media
+                else:
+                    self.frameInterval += (media - self.frameInterval) / 16
+        self.lastArrival = (timestamp, now)
+
+    def targetDelay(self):
+        """Get the playout delay in seconds that absorbs the measured jitter."""
+        return (self.frameInterval or self.FRAME_INTERVAL) + self.JITTER_FACTOR * self.jitter
+
+    def targetFrames(self):
+        """Get the frames to keep buffered for targetDelay(), at least one."""
+        interval = self.frameInterval or self.FRAME_INTERVAL
+        return max(1, math.ceil(self.targetDelay() / interval - 1e-9))
+
+    def due(self, timestamp, now):
+        """Get the local (monotonic) time the frame with this timestamp is due."""
+        if self.anchorTime is None:
+            self.anchor(timestamp, now)
+            return now
+        due = self.anchorTime + self.offset(timestamp)
+        if not -self.maxLate <= due - now <= self.MAX_EARLY:
+            # the stream jumped: play on from this frame
+            self.anchor(timestamp, now)
+            return now
+        return due
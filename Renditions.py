@@ -0,0 +1,156 @@
+import os, sys, argparse
+from io import BytesIO
+
+from VideoStream import VideoStream
+
+try:
+	from PIL import Image
+except ImportError:
+	Image = None
+
+# name, JPEG quality, scale of each rendition, best first; the source file is above them all
+LEVELS = (('q60', 60, 1.0), ('q40', 40, 0.75), ('q25', 25, 0.5))
+
+class Renditions:
+	"""Lower quality copies of a media file, stored next to it.
+
+	A rendition of movie.Mjpeg is movie.q40.Mjpeg: every frame re-encoded
+	with Pillow at a lower JPEG quality and possibly a smaller size, one
+	frame for one frame, so a session can switch files at any frame
+	boundary and keep its frame number. Renditions are standard
+	(concatenated JPEG) MJPEG files and open like any other VideoStream.
+	"""
+
+	@staticmethod
+	def filename(filename, name):
+		"""Get the path of a file's rendition."""
+		base, ext = os.path.splitext(filename)
+		return f"{base}.{name}{ext}"
+
+	@classmethod
+	def available(cls, filename, levels=LEVELS):
+		"""Get the files a session can switch between: the source, then its up-to-date renditions."""
+		files = [filename]
+		try:
+			mtime = os.stat(filename).st_mtime_ns
+		except OSError:
+			return files
+		for name, quality, scale in levels:
+			path = cls.filename(filename, name)
+			try:
+				if os.stat(path).st_mtime_ns >= mtime:
+					files.append(path)
+			except OSError:
+				continue
+		return files
+
+	@classmethod
+	def generate(cls, filename, levels=LEVELS, force=False):
+		"""Write the missing or outdated renditions of a file; return their paths."""
+		if Image is None:
+			raise RuntimeError("generating renditions needs Pillow (pip install Pillow)")
+		stream = VideoStream(filename)
+		written = []
+		try:
+			mtime = os.stat(filename).st_mtime_ns
+			for name, quality, scale in levels:
+				path = cls.filename(filename, name)
+				try:
+					if not force and os.stat(path).st_mtime_ns >= mtime:
+						continue
+				except OSError:
+					pass
+				tmp = path + '.tmp'
+				with open(tmp, 'wb') as out:
+					for n in range(stream.frameCount()):
+						out.write(cls.transcode(stream.getFrame(n), quality, scale))
+				os.replace(tmp, path)
+				written.append(path)
+		finally:
+			stream.close()
+		return written
+
+	@staticmethod
+	def transcode(data, quality, scale):
+		"""Re-encode one JPEG frame; a frame Pillow cannot decode is kept as it is."""
+		try:
+			image = Image.open(BytesIO(data))
+			image.load()
+		except Exception:
+			return bytes(data)
+		if image.mode != 'RGB':
+			image = image.convert('RGB')
+		if scale != 1.0:
+			width, height = image.size
+			image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.BILINEAR)
+		out = BytesIO()
+		image.save(out, 'JPEG', quality=quality)
+		return out.getvalue()
+
+class RateController:
+	"""Choose a session's rendition from the client's loss and buffer reports.
+
+	Level 0 is the source file, higher levels are smaller renditions. The
+	session steps down one level when the client reports packet loss, a
+	stall, or a buffer that is low and falling, and steps back up only
+	after UP_AFTER reports in a row without trouble. Reports arriving
+	within HOLD reports of a switch are ignored, since they mostly
+	describe frames sent before it.
+	"""
+	LOSS_HIGH = 0.05    # loss ratio that makes the session step down
+	LOSS_LOW = 0.01     # loss ratio below which it may step up
+	BUFFER_LOW = 25     # frames ahead of the client's playhead
+	UP_AFTER = 3
+	HOLD = 2
+
+	def __init__(self, levels):
+		self.levels = levels
+		self.level = 0
+		self.good = 0
+		self.hold = 0
+		self.lastBuffer = None
+
+	def update(self, loss, buffered=None, stalled=False):
+		"""Take one feedback report; return the level to stream at."""
+		falling = (buffered is not None and self.lastBuffer is not None
+			and buffered < self.BUFFER_LOW and buffered < self.lastBuffer)
+		self.lastBuffer = buffered
+		if self.hold:
+			self.hold -= 1
+			return self.level
+		if loss > self.LOSS_HIGH or stalled or falling:
+			self.good = 0
+			if self.level < self.levels - 1:
+				self.switch(self.level + 1)
+		elif loss < self.LOSS_LOW and (buffered is None or buffered >= self.BUFFER_LOW):
+			self.good += 1
+			if self.good >= self.UP_AFTER and self.level > 0:
+				self.switch(self.level - 1)
+		else:
+			self.good = 0
+		return self.level
+
+	def switch(self, level):
+		"""Move to a level and give it HOLD reports to take effect."""
+		self.level = level
+		self.good = 0
+		self.hold = self.HOLD
+
+def main():
+	parser = argparse.ArgumentParser(description="Write lower quality renditions of MJPEG files next to them")
+	parser.add_argument('files', nargs='+')
+	parser.add_argument('--force', action='store_true', help="rewrite renditions that are up to date")
+	args = parser.parse_args()
+	for filename in args.files:
+		try:
+			written = Renditions.generate(filename, force=args.force)
+		except (IOError, RuntimeError) as e:
+			print(f"{filename}: {str(e) or 'cannot open'}")
+			sys.exit(1)
+		for path in written:
+			print(f"Wrote {path}")
+		if not written:
+			print(f"{filename}: renditions up to date")
+
+if __name__ == "__main__":
+	main()
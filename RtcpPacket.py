@@ -0,0 +1,275 @@
+import struct, time
+from collections import namedtuple
+
+RTCP_SR = 200
+RTCP_RR = 201
+RTCP_SDES = 202
+RTCP_BYE = 203
+SDES_CNAME = 1
+
+# V/P/count, packet type, length in 32-bit words minus one, SSRC of the sender
+RTCP_HEADER = struct.Struct('!BBHI')
+# NTP seconds, NTP fraction, RTP timestamp, sender's packet count, sender's octet count
+SENDER_INFO = struct.Struct('!IIIII')
+# SSRC, fraction lost << 24 | cumulative lost, extended highest seq, jitter, LSR, DLSR
+REPORT_BLOCK = struct.Struct('!IIIIII')
+
+# seconds from the NTP epoch (1900) to the Unix epoch (1970)
+NTP_OFFSET = 2208988800
+
+ReportBlock = namedtuple('ReportBlock', 'ssrc fractionLost cumulativeLost highestSeq jitter lsr dlsr')
+SenderInfo = namedtuple('SenderInfo', 'ntp rtpTimestamp packets octets')
+
+def ntpTime(t=None):
+	"""Get a wall clock time (default now) as a 64-bit NTP timestamp."""
+	if t is None:
+		t = time.time()
+	return int((t + NTP_OFFSET) * (1 << 32)) & 0xFFFFFFFFFFFFFFFF
+
+def unixTime(ntp):
+	"""Get a 64-bit NTP timestamp as Unix seconds."""
+	return ntp / (1 << 32) - NTP_OFFSET
+
+def middle32(ntp):
+	"""Get the middle 32 bits of an NTP timestamp, the unit of LSR and DLSR (1/65536 s)."""
+	return (ntp >> 16) & 0xFFFFFFFF
+
+def roundTrip(block, t=None):
+	"""Get the round-trip time in seconds from a report block's LSR and DLSR.
+
+	Computed by the sender when the report arrives (RFC 3550 6.4.1); None
+	if the receiver has not had a sender report yet.
+	"""
+	if block.lsr == 0:
+		return None
+	rtt = (middle32(ntpTime(t)) - block.lsr - block.dlsr) & 0xFFFFFFFF
+	if rtt >= 0x80000000:
+		# clocks stepped between the reports
+		return None
+	return rtt / 65536
+
+class RtcpPacket:
+	"""One RTCP packet (RFC 3550): SR, RR, SDES with a CNAME, or BYE.
+
+	Packets travel in compound datagrams starting with an SR or RR; use
+	compound() to build one and decodeCompound() to split one. Types this
+	class does not know are decoded with their SSRC only.
+	"""
+	__slots__ = ('packetType', 'ssrc', 'senderInfo', 'reports', 'cname')
+
+	def __init__(self, packetType, ssrc, senderInfo=None, reports=(), cname=None):
+		self.packetType = packetType
+		self.ssrc = ssrc
+		self.senderInfo = senderInfo
+		self.reports = list(reports)
+		self.cname = cname
+
+	@classmethod
+	def senderReport(cls, ssrc, ntp, rtpTimestamp, packets, octets, reports=()):
+		"""SR: what the sender sent by the wall clock time ntp, plus reception reports."""
+		return cls(RTCP_SR, ssrc, SenderInfo(ntp, rtpTimestamp & 0xFFFFFFFF,
+			packets & 0xFFFFFFFF, octets & 0xFFFFFFFF), reports)
+
+	@classmethod
+	def receiverReport(cls, ssrc, reports=()):
+		"""RR: reception reports from a participant that does not send RTP."""
+		return cls(RTCP_RR, ssrc, reports=reports)
+
+	@classmethod
+	def sourceDescription(cls, ssrc, cname):
+		"""SDES with the CNAME every compound packet must carry."""
+		return cls(RTCP_SDES, ssrc, cname=cname)
+
+	@classmethod
+	def bye(cls, ssrc):
+		"""BYE: the source is leaving the session."""
+		return cls(RTCP_BYE, ssrc)
+
+	@staticmethod
+	def compound(*packets):
+		"""Encode packets into one datagram."""
+		return b''.join(packet.encode() for packet in packets)
+
+	def encode(self):
+		"""Encode the packet as bytes."""
+		if self.packetType == RTCP_SDES:
+			# one chunk: CNAME item, END item, zero padding to a word boundary
+			item = self.cname.encode()[:255]
+			body = bytes((SDES_CNAME, len(item))) + item + b'\x00'
+			body += b'\x00' * (-len(body) % 4)
+			count = 1
+		elif self.packetType == RTCP_BYE:
+			body = b''
+			count = 1
+		else:
+			body = b''
+			if self.packetType == RTCP_SR:
+				ntp, rtpTimestamp, packets, octets = self.senderInfo
+				body = SENDER_INFO.pack(ntp >> 32, ntp & 0xFFFFFFFF, rtpTimestamp, packets, octets)
+			for block in self.reports[:31]:
+				lost = max(-0x800000, min(0x7FFFFF, block.cumulativeLost)) & 0xFFFFFF
+				body += REPORT_BLOCK.pack(block.ssrc, block.fractionLost << 24 | lost,
+					block.highestSeq & 0xFFFFFFFF, block.jitter & 0xFFFFFFFF, block.lsr, block.dlsr)
+			count = min(len(self.reports), 31)
+		length = (RTCP_HEADER.size + len(body)) // 4 - 1
+		return RTCP_HEADER.pack(2 << 6 | count, self.packetType, length, self.ssrc) + body
+
+	@classmethod
+	def decodeCompound(cls, data):
+		"""Split a compound datagram into packets; raise ValueError if it is malformed."""
+		view = memoryview(data)
+		packets = []
+		pos = 0
+		while pos < len(view):
+			if len(view) - pos < RTCP_HEADER.size:
+				raise ValueError("truncated RTCP header")
+			first, packetType, length, ssrc = RTCP_HEADER.unpack_from(view, pos)
+			if first >> 6 != 2:
+				raise ValueError(f"RTCP version {first >> 6}")
+			end = pos + (length + 1) * 4
+			if end > len(view):
+				raise ValueError("truncated RTCP packet")
+			count = first & 0x1F
+			body = pos + RTCP_HEADER.size
+			packet = cls(packetType, ssrc)
+			if packetType in (RTCP_SR, RTCP_RR):
+				if packetType == RTCP_SR:
+					if body + SENDER_INFO.size > end:
+						raise ValueError("truncated RTCP sender info")
+					seconds, fraction, rtpTimestamp, sent, octets = SENDER_INFO.unpack_from(view, body)
+					packet.senderInfo = SenderInfo(seconds << 32 | fraction, rtpTimestamp, sent, octets)
+					body += SENDER_INFO.size
+				if body + count * REPORT_BLOCK.size > end:
+					raise ValueError("truncated RTCP report blocks")
+				for i in range(count):
+					source, lost, highest, jitter, lsr, dlsr = REPORT_BLOCK.unpack_from(view, body + i * REPORT_BLOCK.size)
+					cumulative = lost & 0xFFFFFF
+					if cumulative & 0x800000:
+						cumulative -= 0x1000000
+					packet.reports.append(ReportBlock(source, lost >> 24, cumulative, highest, jitter, lsr, dlsr))
+			elif packetType == RTCP_SDES and count and body + 2 <= end:
+				# CNAME of the first chunk, if it comes first
+				if view[body] == SDES_CNAME:
+					size = view[body + 1]
+					packet.cname = bytes(view[body + 2:min(end, body + 2 + size)]).decode('utf-8', 'replace')
+			packets.append(packet)
+			pos = end
+		return packets
+
+class ReceptionStats:
+	"""Receiver-side statistics of one RTP source (RFC 3550 A.1, A.3, A.8).
+
+	update() is called for every RTP packet with its arrival time in
+	seconds (any clock), senderReport() for every SR from the source, and
+	report() builds the report block sent back in the next RR.
+	"""
+	MAX_DROPOUT = 3000
+	MAX_MISORDER = 100
+	RTP_SEQ_MOD = 1 << 16
+
+	def __init__(self, clockRate):
+		self.clockRate = clockRate
+		self.ssrc = None
+		self.lastSr = 0             # middle 32 bits of the last SR's NTP timestamp
+		self.lastSrArrival = None
+		self.senderInfo = None
+		self.fractionLost = 0
+		self.initSeq(0)
+
+	def initSeq(self, seq):
+		"""Start counting from seq (first packet, or the source restarted its numbering)."""
+		self.baseSeq = seq
+		self.maxSeq = seq
+		self.badSeq = self.RTP_SEQ_MOD + 1
+		self.cycles = 0
+		self.received = 0
+		self.expectedPrior = 0
+		self.receivedPrior = 0
+		self.transit = None
+		self.jitter = 0.0
+
+	def update(self, ssrc, seq, timestamp, arrival):
+		"""Count one RTP packet and update the interarrival jitter."""
+		if ssrc != self.ssrc:
+			self.ssrc = ssrc
+			self.lastSr = 0
+			self.lastSrArrival = None
+			self.initSeq(seq)
+		else:
+			udelta = (seq - self.maxSeq) & 0xFFFF
+			if udelta < self.MAX_DROPOUT:
+				if seq < self.maxSeq:
+					self.cycles += self.RTP_SEQ_MOD
+				self.maxSeq = seq
+			elif udelta <= self.RTP_SEQ_MOD - self.MAX_MISORDER:
+				if seq != self.badSeq:
+					# a very large jump; believe it if the next packet follows on
+					self.badSeq = (seq + 1) & 0xFFFF
+					return
+				self.initSeq(seq)
+			# otherwise a duplicate or reordered packet
+		self.received += 1
+
+		transit = int(arrival * self.clockRate) - timestamp
+		if self.transit is not None:
+			d = (transit - self.transit) & 0xFFFFFFFF
+			if d >= 0x80000000:
+				d = 0x100000000 - d
+			self.jitter += (d - self.jitter) / 16
+		self.transit = transit
+
+	def senderReport(self, packet, arrival):
+		"""Remember an SR from the source for the LSR/DLSR of the next report."""
+		self.lastSr = middle32(packet.senderInfo.ntp)
+		self.lastSrArrival = arrival
+		self.senderInfo = packet.senderInfo
+
+	def senderTime(self, timestamp):
+		"""Get the sender's wall clock time (Unix seconds) at an RTP timestamp.
+
+		Maps the timestamp through the NTP/RTP pair of the latest SR; None
+		before the first one.
+		"""
+		if self.senderInfo is None:
+			return None
+		ticks = (timestamp - self.senderInfo.rtpTimestamp + (1 << 31)) % (1 << 32) - (1 << 31)
+		return unixTime(self.senderInfo.ntp) + ticks / self.clockRate
+
+	def expected(self):
+		"""Get the number of packets expected from the sequence numbers seen."""
+		return self.cycles + self.maxSeq - self.baseSeq + 1 if self.ssrc is not None else 0
+
+	def report(self, now):
+		"""Build the report block for the source; now is on the same clock as the arrival times."""
+		expected = self.expected()
+		expectedInterval = expected - self.expectedPrior
+		receivedInterval = self.received - self.receivedPrior
+		self.expectedPrior = expected
+		self.receivedPrior = self.received
+		lostInterval = expectedInterval - receivedInterval
+		if expectedInterval > 0 and lostInterval > 0:
+			self.fractionLost = min(255, (lostInterval << 8) // expectedInterval)
+		else:
+			self.fractionLost = 0
+		dlsr = 0
+		if self.lastSrArrival is not None:
+			dlsr = int((now - self.lastSrArrival) * 65536) & 0xFFFFFFFF
+		return ReportBlock(self.ssrc, self.fractionLost, expected - self.received,
+			self.cycles + self.maxSeq, int(self.jitter), self.lastSr, dlsr)
+
+	def stats(self):
+		"""Get the reception counters, with jitter in seconds and loss as a fraction."""
+		expected = self.expected()
+		stats = {
+			'ssrc': self.ssrc,
+			'received': self.received,
+			'expected': expected,
+			'cumulativeLost': expected - self.received,
+			'fractionLost': self.fractionLost / 256,
+			'jitter': self.jitter / self.clockRate,
+			'highestSeq': self.cycles + self.maxSeq,
+		}
+		if self.senderInfo is not None:
+			stats['senderPackets'] = self.senderInfo.packets
+			stats['senderOctets'] = self.senderInfo.octets
+		return stats
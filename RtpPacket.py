@@ -1,74 +1,206 @@
-import sys
-from time import time
+import struct
 HEADER_SIZE = 12
+# V/P/X/CC, M/PT, sequence number, timestamp, SSRC
+RTP_HEADER = struct.Struct('!BBHII')
+# header extension: profile-defined id, length in 32-bit words
+EXTENSION_HEADER = struct.Struct('!HH')
 
 class RtpPacket:
-	header = bytearray(HEADER_SIZE)
+	"""RTP packet (RFC 3550) with CSRC list, header extension and padding.
 
-	def __init__(self):
-		pass
-
-	def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, timestamp, payload):
-		"""Encode the RTP packet with header fields and payload."""
-		timestamp = int(time())
-		header = bytearray(HEADER_SIZE)
-		#--------------
-		# TO COMPLETE
-		#--------------
-		# Fill the header bytearray with RTP header fields
+	decode() keeps a memoryview of the datagram and unpacks only the fixed
+	header; the CSRC list, extension and payload bounds are parsed the first
+	time they are asked for, and the payload is a view, never a copy.
+	"""
+	__slots__ = ('buf', 'first', 'second', 'seq', 'ts', 'ssrcId',
+		'csrcList', 'extensionData', 'payload', 'padLength')
 
-		header[0] = (version << 6) | (padding << 5) | (extension << 4) | cc
+	def __init__(self):
+		self.buf = None
+		self.first = 2 << 6
+		self.second = 0
+		self.seq = 0
+		self.ts = 0
+		self.ssrcId = 0
+		self.csrcList = ()
+		self.extensionData = None
+		self.payload = b''
+		self.padLength = 0
 
-		header[1] = (marker << 7) | pt
+	def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, timestamp, payload,
+			csrcs=(), extensionHeader=None):
+		"""Encode the RTP packet with header fields and payload.
 
-		header[2] = (seqnum >> 8) & 0xFF
-		header[3] = seqnum & 0xFF
+		csrcs must hold cc entries, and extensionHeader (profile, data) with
+		len(data) a multiple of 4 must be given when extension is set. With
+		padding set the packet is padded to a multiple of 4 bytes.
+		"""
+		if cc or csrcs or extension or extensionHeader is not None:
+			csrcs = tuple(csrcs)
+			if cc != len(csrcs) or cc > 15:
+				raise ValueError(f"cc={cc} does not match {len(csrcs)} CSRCs")
+			if bool(extension) != (extensionHeader is not None):
+				raise ValueError("extension flag and extension header disagree")
+			if extensionHeader is not None and len(extensionHeader[1]) % 4:
+				raise ValueError("extension data must be a multiple of 4 bytes")
 
-		header[4] = (timestamp >> 24) & 0xFF
-		header[5] = (timestamp >> 16) & 0xFF
-		header[6] = (timestamp >> 8) & 0xFF
-		header[7] = timestamp & 0xFF
+		self.buf = None
+		self.first = version << 6 | (1 if padding else 0) << 5 | (1 if extension else 0) << 4 | cc
+		self.second = marker << 7 | pt
+		self.seq = seqnum & 0xFFFF
+		self.ts = timestamp & 0xFFFFFFFF
+		self.ssrcId = ssrc
+		self.csrcList = csrcs
+		self.extensionData = extensionHeader
+		self.payload = payload
+		self.padLength = 0
+		if padding:
+			self.padLength = 4 - (self.headerSize() + len(payload)) % 4
 
-		header[8] = (ssrc >> 24) & 0xFF
-		header[9] = (ssrc >> 16) & 0xFF
-		header[10] = (ssrc >> 8) & 0xFF
-		header[11] = ssrc & 0xFF
+	def encodeInto(self, buf, offset=0):
+		"""Write the packet into buf at offset; return the number of bytes written."""
+		RTP_HEADER.pack_into(buf, offset, self.first, self.second, self.seq, self.ts, self.ssrcId)
+		pos = offset + HEADER_SIZE
+		if not self.first & 0x3F:
+			payload = self.getPayload()
+			buf[pos:pos + len(payload)] = payload
+			return HEADER_SIZE + len(payload)
+		for csrc in self.csrcs():
+			struct.pack_into('!I', buf, pos, csrc)
+			pos += 4
+		if self.first & 0x10:
+			profile, data = self.extensionHeader()
+			EXTENSION_HEADER.pack_into(buf, pos, profile, len(data) // 4)
+			pos += 4
+			buf[pos:pos + len(data)] = data
+			pos += len(data)
+		payload = self.getPayload()
+		buf[pos:pos + len(payload)] = payload
+		pos += len(payload)
+		if self.first & 0x20:
+			buf[pos:pos + self.padLength - 1] = bytes(self.padLength - 1)
+			buf[pos + self.padLength - 1] = self.padLength
+			pos += self.padLength
+		return pos - offset
 
-		self.header = header
-		# Get the payload from the argument
-		self.payload = payload
-	def marker(self):
-		"""Return marker bit"""
-		return (self.header[1] >> 7) &1
-	
 	def decode(self, byteStream):
 		"""Decode the RTP packet."""
-		self.header = bytearray(byteStream[:HEADER_SIZE])
-		self.payload = byteStream[HEADER_SIZE:]
+		buf = memoryview(byteStream)
+		if len(buf) < HEADER_SIZE:
+			raise ValueError(f"RTP packet too short ({len(buf)} bytes)")
+		self.first, self.second, self.seq, self.ts, self.ssrcId = RTP_HEADER.unpack_from(buf)
+		self.buf = buf
+		self.payload = None
+
+	@classmethod
+	def decodeMany(cls, datagrams):
+		"""Decode a batch of datagrams, skipping any too short to be RTP."""
+		packets = []
+		for datagram in datagrams:
+			if len(datagram) < HEADER_SIZE:
+				continue
+			packet = cls.__new__(cls)
+			packet.decode(datagram)
+			packets.append(packet)
+		return packets
+
+	def parse(self):
+		"""Parse CSRCs, extension and padding of a decoded packet."""
+		buf, first = self.buf, self.first
+		if not first & 0x3F:
+			self.csrcList, self.extensionData, self.padLength = (), None, 0
+			self.payload = buf[HEADER_SIZE:]
+			return
+		end = len(buf)
+		pos = HEADER_SIZE + 4 * (first & 0x0F)
+		self.padLength = buf[end - 1] if first & 0x20 else 0
+		end -= self.padLength
+		self.extensionData = None
+		if first & 0x10:
+			if pos + 4 > end:
+				raise ValueError("RTP header runs past the end of the packet")
+			profile, words = EXTENSION_HEADER.unpack_from(buf, pos)
+			self.extensionData = (profile, buf[pos + 4:pos + 4 + 4 * words])
+			pos += 4 + 4 * words
+		if pos > end:
+			raise ValueError("RTP header runs past the end of the packet")
+		self.csrcList = struct.unpack_from(f'!{first & 0x0F}I', buf, HEADER_SIZE)
+		self.payload = buf[pos:end]
 
 	def version(self):
 		"""Return RTP version."""
-		return int(self.header[0] >> 6)
+		return self.first >> 6
+
+	def padding(self):
+		"""Return padding bit."""
+		return (self.first >> 5) & 1
+
+	def extension(self):
+		"""Return extension bit."""
+		return (self.first >> 4) & 1
+
+	def cc(self):
+		"""Return CSRC count."""
+		return self.first & 0x0F
+
+	def marker(self):
+		"""Return marker bit"""
+		return self.second >> 7
+
+	def payloadType(self):
+		"""Return payload type."""
+		return self.second & 127
 
 	def seqNum(self):
 		"""Return sequence (frame) number."""
-		seqNum = self.header[2] << 8 | self.header[3]
-		return int(seqNum)
+		return self.seq
 
 	def timestamp(self):
 		"""Return timestamp."""
-		timestamp = self.header[4] << 24 | self.header[5] << 16 | self.header[6] << 8 | self.header[7]
-		return int(timestamp)
+		return self.ts
 
-	def payloadType(self):
-		"""Return payload type."""
-		pt = self.header[1] & 127
-		return int(pt)
+	def ssrc(self):
+		"""Return synchronization source."""
+		return self.ssrcId
+
+	def csrcs(self):
+		"""Return the contributing sources."""
+		if self.payload is None:
+			self.parse()
+		return self.csrcList
+
+	def extensionHeader(self):
+		"""Return (profile, data) of the header extension, or None."""
+		if self.payload is None:
+			self.parse()
+		return self.extensionData
+
+	def headerSize(self):
+		"""Return the size of the header including CSRCs and extension."""
+		size = HEADER_SIZE + 4 * (self.first & 0x0F)
+		if self.first & 0x10:
+			extension = self.extensionHeader()
+			size += 4 + len(extension[1])
+		return size
+
+	def size(self):
+		"""Return the size of the whole packet."""
+		if self.buf is not None:
+			return len(self.buf)
+		return self.headerSize() + len(self.payload) + self.padLength
 
 	def getPayload(self):
 		"""Return payload."""
+		if self.payload is None:
+			self.parse()
 		return self.payload
 
 	def getPacket(self):
 		"""Return RTP packet."""
-		return self.header + self.payload
\ No newline at end of file
+		if self.buf is not None:
+			return self.buf
+		if not self.first & 0x3F:
+			return RTP_HEADER.pack(self.first, self.second, self.seq, self.ts, self.ssrcId) + self.payload
+		packet = bytearray(self.size())
+		self.encodeInto(packet)
+		return packet
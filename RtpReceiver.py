@@ -0,0 +1,112 @@
+import sys
+import socket
+import struct
+import selectors
+
+from RtpPacket import RtpPacket, HEADER_SIZE
+
+# Linux: cumulative count of datagrams the kernel dropped on this socket
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+
+
+class RtpReceiver:
+    """Receive RTP datagrams into a preallocated ring of buffers.
+
+    Datagrams are read with recvmsg_into (recv_into where recvmsg is not
+    available) straight into fixed-size slots of one bytearray, and
+    decoded packets are memoryviews of their slot. A slot is reused after
+    `slots` more datagrams, so a consumer must not keep a packet for more
+    than maxAge() further receives (FrameAssembler's maxAge does this).
+
+    On Linux the kernel's count of datagrams dropped because the socket
+    buffer was full (SO_RXQ_OVFL) is reported, so overflow on this host
+    can be told apart from loss in the network.
+    """
+    SLOTS = 1024
+    SLOT_SIZE = 2048         # larger than any datagram on an Ethernet MTU
+    BATCH = 64               # datagrams read per receive() call at most
+    RCVBUF = 4 << 20         # requested SO_RCVBUF; the kernel may clamp it
+
+    def __init__(self, sock, slots=None, slotSize=None, rcvbuf=None, timeout=0.5):
+        self.sock = sock
+        self.slots = slots or self.SLOTS
+        self.slotSize = slotSize or self.SLOT_SIZE
+        self.batch = min(self.BATCH, self.slots // 2)
+        ring = memoryview(bytearray(self.slots * self.slotSize))
+        self.ring = [ring[i * self.slotSize:(i + 1) * self.slotSize] for i in range(self.slots)]
+        self.next = 0
+        self.timeout = timeout
+        self.counters = {'datagrams': 0, 'truncated': 0, 'kernelDrops': 0}
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf or self.RCVBUF)
+        except OSError as e:
+            print(f"SO_RCVBUF not set: {e}")
+        self.rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+        self.useRecvmsg = hasattr(sock, 'recvmsg_into')
+        self.ancillarySize = 0
+        if self.useRecvmsg and sys.platform.startswith('linux'):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self.ancillarySize = socket.CMSG_SPACE(4)
+            except OSError:
+                pass
+
+        # the socket is drained without blocking; waiting happens here
+        sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(sock, selectors.EVENT_READ)
+
+    def maxAge(self):
+        """Get how many more datagrams a received packet stays valid for."""
+        return self.slots - self.batch
+
+    def receive(self):
+        """Wait for datagrams and return the queued ones as decoded RtpPackets.
+
+        Raises socket.timeout if nothing arrives within the timeout.
+        """
+        views = self.receiveViews()
+        if not views and not self.selector.select(self.timeout):
+            raise socket.timeout("timed out")
+        if not views:
+            views = self.receiveViews()
+        return RtpPacket.decodeMany(views)
+
+    def receiveViews(self):
+        """Read up to one batch of queued datagrams without blocking."""
+        views = []
+        sock, ring = self.sock, self.ring
+        while len(views) < self.batch:
+            slot = ring[self.next]
+            try:
+                if self.useRecvmsg:
+                    nbytes, ancdata, flags, address = sock.recvmsg_into([slot], self.ancillarySize)
+                else:
+                    nbytes, flags, ancdata = sock.recv_into(slot), 0, ()
+            except (BlockingIOError, InterruptedError):
+                break
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(data) >= 4:
+                    self.counters['kernelDrops'] = struct.unpack('=I', data[:4])[0]
+            self.counters['datagrams'] += 1
+            if flags & socket.MSG_TRUNC:
+                self.counters['truncated'] += 1
+                continue
+            if nbytes < HEADER_SIZE:
+                # not RTP; leave the slot for the next datagram
+                continue
+            self.next = (self.next + 1) % self.slots
+            views.append(slot[:nbytes])
+        return views
+
+    def stats(self):
+        """Get datagram, truncation and kernel drop counts and the socket buffer size."""
+        stats = dict(self.counters)
+        stats['rcvbuf'] = self.rcvbuf
+        return stats
+
+    def close(self):
+        """Stop watching the socket (the caller closes it)."""
+        self.selector.close()
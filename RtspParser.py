@@ -0,0 +1,215 @@
+import re
+
+RTSP_VERSION = 'RTSP/1.0'
+CRLF = '\r\n'
+
+# end of the header block: an empty line, CRLF or bare LF line endings
+HEADER_END = re.compile(rb'\r?\n\r?\n')
+LINE_END = re.compile(r'\r?\n')
+METHOD = re.compile(r'[A-Za-z_-]+')
+
+REASONS = {
+	200: 'OK',
+	400: 'Bad Request',
+	404: 'Not Found',
+	405: 'Method Not Allowed',
+	413: 'Request Entity Too Large',
+	453: 'Not Enough Bandwidth',
+	454: 'Session Not Found',
+	455: 'Method Not Valid in This State',
+	457: 'Invalid Range',
+	461: 'Unsupported Transport',
+	500: 'Internal Server Error',
+}
+
+class RtspError(ValueError):
+	"""A malformed RTSP message; code is the status to answer a request with."""
+
+	def __init__(self, message, code=400):
+		super().__init__(message)
+		self.code = code
+
+class RtspMessage:
+	"""One RTSP request or response: start line, header fields and body.
+
+	Header fields are kept in a dict keyed by lower-case name (a repeated
+	field keeps its last value) and written back with the names given.
+	"""
+	__slots__ = ('startLine', 'headers', 'names', 'body')
+
+	def __init__(self, startLine, headers=(), body=b''):
+		self.startLine = startLine
+		self.headers = {}
+		self.names = {}
+		for name, value in headers:
+			self.set(name, value)
+		self.body = body
+
+	@classmethod
+	def request(cls, method, uri, headers=(), body=b''):
+		return cls(f"{method} {uri} {RTSP_VERSION}", headers, body)
+
+	@classmethod
+	def response(cls, code, headers=(), body=b'', reason=None):
+		return cls(f"{RTSP_VERSION} {code} {reason or REASONS.get(code, 'Unknown')}", headers, body)
+
+	def set(self, name, value):
+		"""Set a header field, replacing one of the same name."""
+		key = name.lower()
+		self.headers[key] = str(value)
+		self.names[key] = name
+
+	def get(self, name, default=None):
+		"""Get a header field by name, in any case."""
+		return self.headers.get(name.lower(), default)
+
+	def isResponse(self):
+		return self.startLine.startswith('RTSP/')
+
+	@property
+	def method(self):
+		return self.startLine.split(' ', 1)[0]
+
+	@property
+	def uri(self):
+		return self.startLine.split(' ')[1]
+
+	@property
+	def statusCode(self):
+		return int(self.startLine.split(' ')[1])
+
+	@property
+	def cseq(self):
+		"""Get the CSeq as an int, None if it is missing or not a number."""
+		try:
+			return int(self.headers['cseq'])
+		except (KeyError, ValueError):
+			return None
+
+	def parameters(self):
+		"""Get the 'name: value' lines of a text/parameters body, keyed by lower-case name."""
+		params = {}
+		for line in LINE_END.split(self.body.decode('utf-8', 'replace')):
+			name, sep, value = line.partition(':')
+			if sep:
+				params[name.strip().lower()] = value.strip()
+		return params
+
+	def encode(self):
+		"""Encode the message with CRLF line endings; Content-Length is set from the body."""
+		if self.body:
+			self.set(self.names.get('content-length', 'Content-Length'), len(self.body))
+		lines = [self.startLine]
+		lines.extend(f"{self.names[key]}: {value}" for key, value in self.headers.items())
+		return (CRLF.join(lines) + CRLF + CRLF).encode() + self.body
+
+	def __str__(self):
+		return self.encode().decode('utf-8', 'replace')
+
+class RtspParser:
+	"""Incremental RTSP parser for one connection, used by both ends.
+
+	feed() takes bytes as they come off the socket, in chunks of any size,
+	and returns the messages they complete, so a message split across
+	reads and several messages in one read (pipelining) both work. A
+	message is a start line and header fields up to an empty line, with
+	either CRLF or LF line endings, followed by Content-Length bytes of
+	body. Raises RtspError on input that cannot be RTSP; the connection
+	should then be closed, since the stream has lost its framing.
+	"""
+	MAX_HEADER_SIZE = 8192
+	MAX_BODY_SIZE = 64 * 1024
+
+	def __init__(self):
+		self.buffer = bytearray()
+		self.pos = 0                # start of the bytes not consumed yet
+		self.scanFrom = 0           # where the search for the end of the header resumes
+		self.message = None         # header parsed, body still arriving
+		self.bodySize = 0
+
+	def feed(self, data):
+		"""Add received bytes; return the list of messages now complete."""
+		self.buffer += data
+		messages = []
+		try:
+			while True:
+				message = self.next()
+				if message is None:
+					return messages
+				messages.append(message)
+		finally:
+			# drop consumed bytes once per read, not once per message
+			if self.pos:
+				del self.buffer[:self.pos]
+				self.scanFrom = max(0, self.scanFrom - self.pos)
+				self.pos = 0
+
+	def next(self):
+		"""Take one complete message from the buffer, or None if there is none yet."""
+		buffer = self.buffer
+		if self.message is None:
+			# empty lines between messages are allowed
+			pos = self.pos
+			while pos < len(buffer) and buffer[pos] in b'\r\n':
+				pos += 1
+			self.pos = pos
+			match = HEADER_END.search(buffer, max(pos, self.scanFrom))
+			if match is None:
+				if len(buffer) - pos > self.MAX_HEADER_SIZE:
+					raise RtspError("header block too long", 413)
+				# a terminator may be cut after up to three of its bytes
+				self.scanFrom = max(pos, len(buffer) - 3)
+				return None
+			if match.start() - pos > self.MAX_HEADER_SIZE:
+				raise RtspError("header block too long", 413)
+			self.message = self.parseHead(bytes(buffer[pos:match.start()]))
+			self.pos = match.end()
+		end = self.pos + self.bodySize
+		if len(buffer) < end:
+			return None
+		message, self.message = self.message, None
+		message.body = bytes(buffer[self.pos:end]) if self.bodySize else b''
+		self.pos = self.scanFrom = end
+		return message
+
+	def parseHead(self, head):
+		"""Parse the start line and header fields; set the body size from Content-Length."""
+		try:
+			text = head.decode('utf-8')
+		except UnicodeDecodeError:
+			raise RtspError("header is not UTF-8")
+		lines = LINE_END.split(text)
+		startLine = lines[0].strip()
+		parts = startLine.split(' ')
+		if parts[0] == RTSP_VERSION:
+			valid = len(parts) >= 2 and len(parts[1]) == 3 and parts[1].isascii() and parts[1].isdigit()
+		else:
+			valid = len(parts) == 3 and parts[2] == RTSP_VERSION and METHOD.fullmatch(parts[0]) is not None
+		if not valid:
+			raise RtspError(f"bad start line {startLine[:64]!r}")
+		message = RtspMessage(startLine)
+		headers, names = message.headers, message.names
+		key = None
+		for line in lines[1:]:
+			if line[:1] in (' ', '\t') and key is not None:
+				# folded continuation of the previous field
+				headers[key] += ' ' + line.strip()
+				continue
+			name, sep, value = line.partition(':')
+			name = name.strip()
+			if not sep or not name or ' ' in name:
+				raise RtspError(f"bad header line {line[:64]!r}")
+			key = name.lower()
+			headers[key] = value.strip()
+			names[key] = name
+		length = headers.get('content-length', '0')
+		if not (length.isascii() and length.isdigit()):
+			raise RtspError(f"bad Content-Length {length[:32]!r}")
+		self.bodySize = int(length)
+		if self.bodySize > self.MAX_BODY_SIZE:
+			raise RtspError("body too long", 413)
+		return message
+
+	def pending(self):
+		"""Get the number of bytes received that are not part of a complete message yet."""
+		return len(self.buffer) - self.pos
@@ -0,0 +1,108 @@
+import heapq, itertools, threading, queue, logging
+from time import monotonic
+
+log = logging.getLogger(__name__)
+
+class SendScheduler:
+	"""One deadline heap for every playing session, served by a fixed pool of sender threads.
+
+	A task is any object with a sendDue() method that does one slice of
+	sending and returns the monotonic time it wants to run again, or None
+	to stop. A task is never run by two senders at once.
+	"""
+	SENDER_THREADS = 4
+
+	_shared = None
+	_sharedLock = threading.Lock()
+
+	@classmethod
+	def shared(cls):
+		"""Get the process-wide scheduler, starting it on first use."""
+		with cls._sharedLock:
+			if cls._shared is None:
+				cls._shared = cls(cls.SENDER_THREADS)
+			return cls._shared
+
+	def __init__(self, senders):
+		self.heap = []          # (deadline, seq, task); stale entries are skipped
+		self.entries = {}       # task -> seq of its live entry
+		self.running = set()
+		self.deferred = {}      # task -> seq that came due while the task was running
+		self.cancelling = set() # tasks cancel() is waiting on
+		self.counter = itertools.count()
+		self.cond = threading.Condition()
+		self.ready = queue.SimpleQueue()
+		threading.Thread(target=self.dispatch, name="rtp-dispatch", daemon=True).start()
+		for i in range(senders):
+			threading.Thread(target=self.runSender, name=f"rtp-sender-{i}", daemon=True).start()
+
+	def schedule(self, task, deadline):
+		"""Run task.sendDue() at deadline, replacing any pending entry for the task."""
+		with self.cond:
+			self.push(task, deadline)
+
+	def cancel(self, task):
+		"""Stop running the task, waiting for a send already in progress to finish."""
+		with self.cond:
+			self.entries.pop(task, None)
+			self.deferred.pop(task, None)
+			while task in self.running:
+				self.cancelling.add(task)
+				self.cond.wait()
+			self.cancelling.discard(task)
+
+	def push(self, task, deadline):
+		seq = next(self.counter)
+		self.entries[task] = seq
+		heapq.heappush(self.heap, (deadline, seq, task))
+		if self.heap[0][1] == seq:
+			self.cond.notify()
+
+	def dispatch(self):
+		"""Hand tasks to the sender pool as their deadlines pass."""
+		while True:
+			with self.cond:
+				while True:
+					if not self.heap:
+						self.cond.wait()
+						continue
+					deadline, seq, task = self.heap[0]
+					if self.entries.get(task) != seq:
+						heapq.heappop(self.heap)
+						continue
+					delay = deadline - monotonic()
+					if delay > 0:
+						self.cond.wait(delay)
+						continue
+					heapq.heappop(self.heap)
+					if task in self.running:
+						self.deferred[task] = seq
+						continue
+					self.running.add(task)
+					break
+			self.ready.put((task, seq))
+
+	def runSender(self):
+		while True:
+			task, seq = self.ready.get()
+			try:
+				deadline = task.sendDue()
+			except Exception as e:
+				log.exception("Sender error: %s", e)
+				deadline = None
+			with self.cond:
+				self.running.discard(task)
+				if task in self.cancelling:
+					# wakes the dispatcher too, which just goes back to waiting
+					self.cond.notify_all()
+				if task in self.deferred:
+					# rescheduled while running; its new entry is already due
+					seq = self.deferred.pop(task)
+					if self.entries.get(task) == seq:
+						self.running.add(task)
+						self.ready.put((task, seq))
+				elif self.entries.get(task) == seq:
+					if deadline is None:
+						del self.entries[task]
+					else:
+						self.push(task, deadline)
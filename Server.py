@@ -1,54 +1,289 @@
-import sys, socket
+import os, socket, argparse, json, signal, selectors, threading, time, logging
 
 from ServerWorker import ServerWorker
+from SendScheduler import SendScheduler
+from FramePacer import FramePacer
+from UdpBatchSender import UdpBatchSender
+from PacketCache import PacketCache
+from VideoStream import MediaFile
+from Metrics import Metrics, MetricsServer
+
+log = logging.getLogger('Server')
+
+class Server:
+	# seconds between stats reports from worker processes
+	STATS_INTERVAL = 1.0
+	# seconds between combined stats lines printed by the supervisor
+	REPORT_INTERVAL = 10.0
+	# minimum seconds between restarts of the same worker slot
+	RESTART_BACKOFF = 1.0
 
-class Server:	
-	
 	def main(self):
-		try:
-			SERVER_PORT = int(sys.argv[1])
-		except:
-			print("[Usage: Server.py Server_port]\n")
+		parser = argparse.ArgumentParser(usage="Server.py Server_port [--engine threads|asyncio] [--workers N] [--fps FPS]")
+		parser.add_argument('port', type=int)
+		parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads',
+			help="threads: one RTSP thread per client and a shared RTP sender pool; asyncio: all sessions in one event loop")
+		parser.add_argument('--workers', type=int, default=1,
+			help="number of server processes sharing the RTSP port (SO_REUSEPORT)")
+		parser.add_argument('--fps', type=float,
+			help="frame rate to stream at (default: the video file's)")
+		parser.add_argument('--sender-threads', type=int, default=SendScheduler.SENDER_THREADS,
+			help="threads sending RTP for all sessions (threads engine)")
+		parser.add_argument('--burst', type=int, default=FramePacer.BURST,
+			help="RTP packets sent back to back (in one syscall with GSO)")
+		parser.add_argument('--no-gso', action='store_true',
+			help="send one packet per syscall instead of using UDP segmentation offload")
+		parser.add_argument('--packet-cache', type=int, default=PacketCache.BUDGET >> 20, metavar='MB',
+			help="memory for frames already cut into RTP payloads, shared by sessions (0 disables)")
+		parser.add_argument('--no-adaptive', action='store_true',
+			help="always stream the source file, never its renditions (see Renditions.py)")
+		parser.add_argument('--metrics-port', type=int,
+			help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics")
+		parser.add_argument('--session-timeout', type=int, default=ServerWorker.SESSION_TIMEOUT, metavar='SECONDS',
+			help="tear down sessions with no RTSP request or RTCP report for this long")
+		parser.add_argument('--max-sessions', type=int,
+			help="sessions each server process serves at once; more SETUPs get 453 Not Enough Bandwidth")
+		parser.add_argument('--log-level', choices=('debug', 'info', 'warning', 'error'), default='info',
+			help="debug also logs every RTSP request and reply")
+		args = parser.parse_args()
+		logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+		ServerWorker.FRAME_RATE = args.fps
+		SendScheduler.SENDER_THREADS = args.sender_threads
+		FramePacer.BURST = args.burst
+		if args.no_gso:
+			UdpBatchSender.useGso = False
+		PacketCache.BUDGET = args.packet_cache << 20
+		if args.no_adaptive:
+			ServerWorker.ADAPTIVE = False
+		ServerWorker.SESSION_TIMEOUT = args.session_timeout
+		ServerWorker.MAX_SESSIONS = args.max_sessions
+		# clients name media relative to the working directory; never write index files outside it
+		MediaFile.INDEX_ROOT = os.getcwd()
+
+		if args.workers > 1:
+			self.serveWorkers(args)
 			return
-		
+
+		rtspSocket = self.openRtspSocket(args.port)
+		if rtspSocket is not None:
+			if args.metrics_port:
+				self.startMetrics(args.metrics_port, Metrics.shared().snapshot)
+			self.serve(rtspSocket, args.engine)
+
+	def startMetrics(self, port, snapshot):
+		"""Serve metrics over HTTP on a local port, if it is free."""
+		try:
+			MetricsServer(port, snapshot).start()
+		except OSError as e:
+			log.error("Metrics port %d not available: %s", port, e)
+
+	def openRtspSocket(self, SERVER_PORT, reusePort=False):
+		"""Create the listening RTSP socket; return None if the port is unavailable."""
 		rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		rtspSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		if reusePort:
+			rtspSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
 		rtspSocket.settimeout(1.0)
 
 		try:
 			rtspSocket.bind(('', SERVER_PORT))
-			rtspSocket.listen(5)        
+			rtspSocket.listen(socket.SOMAXCONN)
 		except OSError as e:
-			print(f"Error {e}")
-			print(f"Port {SERVER_PORT} might be in use. Try lsof -ti :{SERVER_PORT} | xargs kill -9")
-			return
+			rtspSocket.close()
+			log.error("Error %s", e)
+			log.error("Port %d might be in use. Try lsof -ti :%d | xargs kill -9", SERVER_PORT, SERVER_PORT)
+			return None
+		return rtspSocket
+
+	def serve(self, rtspSocket, engine):
+		if engine == 'asyncio':
+			self.serveAsyncio(rtspSocket)
+		else:
+			self.serveThreads(rtspSocket)
+
+	def serveThreads(self, rtspSocket):
+		"""Accept clients and hand each one to a ServerWorker thread."""
 		# Receive client info (address,port) through RTSP/TCP session
-		clients = []
+		ServerWorker.startReaper()
 		try:
 			while True:
 				try:
 					clientInfo = {}
 					clientInfo['rtspSocket'] = rtspSocket.accept()
-					clients.append(clientInfo['rtspSocket'][0])
-					print(f"Client connected from {clientInfo['rtspSocket'][1]}")
-					ServerWorker(clientInfo).run()		
+					log.info("Client connected from %s", clientInfo['rtspSocket'][1])
+					ServerWorker(clientInfo).run()
 				except socket.timeout:
 					continue
 				except Exception as e:
-					print(f"Client error: {e}")
+					log.error("Client error: %s", e)
 					continue
 		except KeyboardInterrupt:
-			print("\n\n Server shutting down...")
+			log.info("Server shutting down...")
+		finally:
+			# each worker thread tears its session down as its connection ends
+			for worker in list(ServerWorker.connections):
+				worker.expire()
+			rtspSocket.close()
+			log.info("Server stopped")
+
+	def serveAsyncio(self, rtspSocket):
+		"""Run every session in one asyncio event loop."""
+		from AsyncServer import AsyncServer
+		try:
+			AsyncServer(rtspSocket).run()
+		except KeyboardInterrupt:
+			log.info("Server shutting down...")
+		finally:
+			rtspSocket.close()
+			log.info("Server stopped")
+
+	# ------------------------------------------------------------
+	# Multi-process mode
+	# ------------------------------------------------------------
+	def serveWorkers(self, args):
+		"""Fork worker processes that each accept on the RTSP port, and supervise them."""
+		reusePort = hasattr(socket, 'SO_REUSEPORT')
+		# bind once up front: fails early if the port is taken, and is the
+		# shared listening socket on platforms without SO_REUSEPORT
+		sharedSocket = self.openRtspSocket(args.port, reusePort)
+		if sharedSocket is None:
+			return
+		if reusePort:
+			sharedSocket.close()
+			sharedSocket = None
+
+		self.workers = {}       # pid -> slot
+		self.lastStats = {}     # slot -> latest metrics snapshot from the running worker
+		self.retiredStats = {}  # counters of workers that have exited
+		self.partialLines = {}  # slot -> start of a stats line not fully read yet
+		self.startTimes = {}    # slot -> last start time
+		self.selector = selectors.DefaultSelector()
+		for slot in range(args.workers):
+			self.startWorker(slot, args, sharedSocket)
+
+		log.info("Started %d workers on port %d", args.workers, args.port)
+		if args.metrics_port:
+			self.startMetrics(args.metrics_port, self.combinedStats)
+		nextReport = time.monotonic() + self.REPORT_INTERVAL
+		# stop and reap the workers on kill/systemd stop too, not only on Ctrl-C
+		signal.signal(signal.SIGTERM, signal.default_int_handler)
+		try:
+			while True:
+				for key, _ in self.selector.select(timeout=self.STATS_INTERVAL):
+					self.readWorkerStats(key)
+				self.reapWorkers(args, sharedSocket)
+				if time.monotonic() >= nextReport:
+					nextReport += self.REPORT_INTERVAL
+					self.printStats()
+		except KeyboardInterrupt:
+			log.info("Server shutting down...")
 		finally:
-			for client_socket in clients:
+			for pid in list(self.workers):
 				try:
-					client_socket.close()
-				except:
+					os.kill(pid, signal.SIGTERM)
+				except ProcessLookupError:
 					pass
-			rtspSocket.close()
-			print("Server stopped")
-		
+			for pid in list(self.workers):
+				try:
+					os.waitpid(pid, 0)
+				except ChildProcessError:
+					pass
+			if sharedSocket is not None:
+				sharedSocket.close()
+			self.printStats()
+			log.info("Server stopped")
+
+	def startWorker(self, slot, args, sharedSocket):
+		"""Fork the worker process for a slot."""
+		readFd, writeFd = os.pipe()
+		pid = os.fork()
+		if pid == 0:
+			os.close(readFd)
+			status = 0
+			try:
+				self.runWorker(args, sharedSocket, writeFd)
+			except BaseException:
+				status = 1
+			finally:
+				os._exit(status)
+		os.close(writeFd)
+		self.workers[pid] = slot
+		self.startTimes[slot] = time.monotonic()
+		self.selector.register(os.fdopen(readFd, 'rb', buffering=0), selectors.EVENT_READ, slot)
+
+	def runWorker(self, args, sharedSocket, statsFd):
+		"""Worker process body: report stats in the background and serve."""
+		signal.signal(signal.SIGTERM, signal.default_int_handler)
+		self.selector = None
+		rtspSocket = sharedSocket or self.openRtspSocket(args.port, reusePort=True)
+		if rtspSocket is None:
+			raise SystemExit(1)
+		threading.Thread(target=self.reportStats, args=(statsFd,), daemon=True).start()
+		self.serve(rtspSocket, args.engine)
+
+	def reportStats(self, statsFd):
+		"""Send this process's metrics to the supervisor, one JSON line per interval."""
+		while True:
+			time.sleep(self.STATS_INTERVAL)
+			line = json.dumps(Metrics.shared().snapshot()) + '\n'
+			try:
+				os.write(statsFd, line.encode())
+			except OSError:
+				return
+
+	def readWorkerStats(self, key):
+		"""Take the latest complete stats line from a worker pipe."""
+		slot = key.data
+		try:
+			data = key.fileobj.read(65536)
+		except OSError:
+			data = b''
+		if not data:
+			self.selector.unregister(key.fileobj)
+			key.fileobj.close()
+			self.partialLines.pop(slot, None)
+			return
+		# a snapshot with many sessions can span several reads
+		lines = (self.partialLines.pop(slot, b'') + data).split(b'\n')
+		if lines[-1]:
+			self.partialLines[slot] = lines[-1]
+		for line in reversed(lines[:-1]):
+			if line:
+				try:
+					self.lastStats[slot] = json.loads(line)
+				except ValueError:
+					continue
+				break
+
+	def reapWorkers(self, args, sharedSocket):
+		"""Restart workers that exited, carrying their counters over."""
+		while self.workers:
+			try:
+				pid, status = os.waitpid(-1, os.WNOHANG)
+			except ChildProcessError:
+				return
+			if pid == 0:
+				return
+			slot = self.workers.pop(pid, None)
+			if slot is None:
+				continue
+			# its sessions are gone, what it sent still counts
+			self.retiredStats = Metrics.merge([self.retiredStats, self.lastStats.pop(slot, {})], retired=True)
+			log.warning("Worker %d (pid %d) exited with status %d; restarting", slot, pid, os.waitstatus_to_exitcode(status))
+			wait = self.startTimes[slot] + self.RESTART_BACKOFF - time.monotonic()
+			if wait > 0:
+				time.sleep(wait)
+			self.startWorker(slot, args, sharedSocket)
+
+	def combinedStats(self):
+		"""Add up the metrics of all current and past workers."""
+		return Metrics.merge([self.retiredStats] + list(self.lastStats.values()))
+
+	def printStats(self):
+		totals = Metrics.totals(self.combinedStats())
+		log.info("[%d workers] %s", len(self.workers), " ".join(f"{name}={value}" for name, value in sorted(totals.items())))
+
 
 if __name__ == "__main__":
-	(Server()).main()
\ No newline at end of file
+	(Server()).main()
@@ -1,16 +1,55 @@
 from random import randint
-import sys, traceback, threading, socket
+from itertools import islice
+import sys, math, traceback, threading, socket, errno, struct, weakref, logging
 
 from VideoStream import VideoStream
-from RtpPacket import RtpPacket
-from time import time
+from PacketCache import PacketCache
+from Renditions import Renditions, RateController
+from RtpPacket import RtpPacket, RTP_HEADER, HEADER_SIZE
+from RtcpPacket import RtcpPacket, RTCP_RR, RTCP_SR, ntpTime, roundTrip
+from RtspParser import RtspParser, RtspMessage, RtspError
+from FramePacer import FramePacer
+from SendScheduler import SendScheduler
+from UdpBatchSender import UdpBatchSender
+from Metrics import Metrics
+from time import monotonic, perf_counter, sleep
+
+log = logging.getLogger(__name__)
+
+# Linux: kernel receive time (struct timeval) as ancillary data on each datagram
+SO_TIMESTAMP = getattr(socket, 'SO_TIMESTAMP', 29) if sys.platform.startswith('linux') else None
 
 class ServerWorker:
 	SETUP = 'SETUP'
 	PLAY = 'PLAY'
 	PAUSE = 'PAUSE'
 	TEARDOWN = 'TEARDOWN'
+	SET_PARAMETER = 'SET_PARAMETER'
+	GET_PARAMETER = 'GET_PARAMETER'
+	OPTIONS = 'OPTIONS'
+	METHODS = (SETUP, PLAY, PAUSE, TEARDOWN, SET_PARAMETER, GET_PARAMETER, OPTIONS)
 	MAX_PAYLOAD_SIZE = 1400
+	RTP_PAYLOAD_TYPE = 26
+	RTP_SSRC = 1111
+	# RTP timestamp units per second (90 kHz for JPEG video, RFC 2435)
+	RTP_CLOCK_RATE = 90000
+	# seconds between RTCP sender reports while playing
+	RTCP_INTERVAL = 1.0
+	# Frame rate to stream at; None uses the video file's own rate
+	FRAME_RATE = None
+	# Serve frames as slices of one shared memory map per file
+	USE_MMAP = True
+	# Switch sessions between renditions of the file from client feedback
+	ADAPTIVE = True
+	# bytes read from the RTSP connection at a time
+	RTSP_RECV_SIZE = 4096
+	# seconds a connection may go without an RTSP request or RTCP report
+	# before it is torn down; announced to clients in the Session header
+	SESSION_TIMEOUT = 60
+	# seconds between checks for idle connections
+	REAP_INTERVAL = 5.0
+	# sessions this process serves at once; None for no limit
+	MAX_SESSIONS = None
 	
 	INIT = 0
 	READY = 1
@@ -20,164 +59,712 @@ class ServerWorker:
 	OK_200 = 0
 	FILE_NOT_FOUND_404 = 1
 	CON_ERR_500 = 2
+	INVALID_RANGE_457 = 3
+	UNSUPPORTED_TRANSPORT_461 = 4
+	NOT_ENOUGH_BANDWIDTH_453 = 5
+	METHOD_NOT_ALLOWED_405 = 6
 	
 	clientInfo = {}
+
+	# Process-wide metrics, combined across processes by Server --workers
+	metrics = Metrics.shared()
+	sessionsStarted = metrics.counter('sessions_total', "RTSP sessions set up")
+	sessionsActive = metrics.gauge('sessions_active', "Sessions set up and not torn down")
+	sessionsRejected = metrics.counter('sessions_rejected_total', "SETUP requests refused because MAX_SESSIONS were active")
+	sessionsExpired = metrics.counter('sessions_expired_total', "Connections torn down after SESSION_TIMEOUT without a request or report")
+	connectionsOpen = metrics.gauge('connections_open', "Open RTSP connections")
+	framesSent = metrics.counter('frames_sent_total', "Video frames sent")
+	framesSkipped = metrics.counter('frames_skipped_total', "Frames skipped to catch up with the media clock")
+	packetsSent = metrics.counter('packets_sent_total', "RTP packets sent")
+	bytesSent = metrics.counter('bytes_sent_total', "RTP payload bytes sent")
+	sendErrors = metrics.counter('send_errors_total', "RTP packets that could not be sent")
+	cacheMisses = metrics.counter('packet_cache_misses_total', "Frames read and cut into payloads because they were not cached")
+	renditionSwitches = metrics.counter('rendition_switches_total', "Sessions switched to another rendition")
+	sendLatency = metrics.histogram('send_call_seconds', "Time spent in one RTP send call (one burst)")
+	frameReadLatency = metrics.histogram('frame_read_seconds', "Time to read a frame and cut it into RTP payloads")
+	# sessions between SETUP and TEARDOWN, for the per-session metrics
+	sessions = weakref.WeakSet()
+	# workers with an open RTSP connection, for the idle reaper
+	connections = weakref.WeakSet()
+	sessionLock = threading.Lock()
 	
 	def __init__(self, clientInfo):
 		self.clientInfo = clientInfo
 		
 	def run(self):
+		self.connected()
 		threading.Thread(target=self.recvRtspRequest).start()
 	
 	def recvRtspRequest(self):
-		"""Receive RTSP request from the client."""
+		"""Receive RTSP requests from the client, however TCP splits or joins them."""
 		connSocket = self.clientInfo['rtspSocket'][0]
-		while True:     
-			try:       
-				data = connSocket.recv(256)
-				if data:
-					print("Data received:\n" + data.decode("utf-8"))
-					self.processRtspRequest(data.decode("utf-8"))
-				else:
+		parser = RtspParser()
+		try:
+			while True:     
+				try:       
+					data = connSocket.recv(self.RTSP_RECV_SIZE)
+					if not data:
+						break
+					for request in parser.feed(data):
+						log.debug("Data received:\n%s", request)
+						self.processRtspRequest(request)
+				except RtspError as e:
+					self.badRequest(e)
 					break
-			except OSError:
-				break
-			except Exception as e:
-				print(f"Error receiving data: {e}")
-				break
+				except OSError:
+					break
+				except Exception as e:
+					log.error("Error receiving data: %s", e)
+					break
+		finally:
+			# without a TEARDOWN too: the client went away or the session expired
+			self.closeConnection()
+
+	def badRequest(self, error):
+		"""Answer a request that could not be parsed; the connection is unusable after it."""
+		log.info("Bad request from %s: %s", self.clientAddress(), error)
+		try:
+			self.sendRtspReply(RtspMessage.response(error.code))
+		except OSError:
+			pass
 				
-	def processRtspRequest(self, data):
-		"""Process RTSP request sent from the client."""
+	def processRtspRequest(self, request):
+		"""Process one parsed RTSP request from the client."""
 		# Get the request type
-		request = data.split('\n')
-		line1 = request[0].split(' ')
-		requestType = line1[0]
+		requestType = request.method
 		
 		# Get the media file name
-		filename = line1[1]
+		filename = request.uri
 		
 		# Get the RTSP sequence number 
-		seq = request[1].split(' ')
+		seq = request.get('cseq', '0')
+
+		headers = request.headers
+
+		# any request keeps the session alive
+		self.clientInfo['lastActivity'] = monotonic()
 		
 		# Process SETUP request
 		if requestType == self.SETUP:
 			if self.state == self.INIT:
-				# Update state
-				print("processing SETUP\n")
-				
+				log.debug("processing SETUP")
+				rtpPort = self.admitSetup(headers, seq)
+				if rtpPort is None:
+					return
 				try:
-					self.clientInfo['videoStream'] = VideoStream(filename)
-					self.state = self.READY
+					stream = self.openStream(filename)
 				except IOError:
-					self.replyRtsp(self.FILE_NOT_FOUND_404, seq[1])
-				
-				# Generate a randomized RTSP session ID
-				self.clientInfo['session'] = randint(100000, 999999)
-				
-				# Send RTSP reply
-				self.replyRtsp(self.OK_200, seq[1])
-				
-				# Get the RTP/UDP port from the last line
-				self.clientInfo['rtpPort'] = request[2].split(' ')[3]
+					self.endSession()
+					self.replyRtsp(self.FILE_NOT_FOUND_404, seq)
+					return
+				self.completeSetup(stream, filename, rtpPort, seq)
 		
 		# Process PLAY request 		
 		elif requestType == self.PLAY:
-			if self.state == self.READY:
-				print("processing PLAY\n")
-				self.state = self.PLAYING
-				
-				# Create a new socket for RTP/UDP
-				self.clientInfo["rtpSocket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-				
-				self.replyRtsp(self.OK_200, seq[1])
+			if self.state in (self.READY, self.PLAYING):
+				log.debug("processing PLAY")
+				stream = self.clientInfo['videoStream']
+				try:
+					unit, start = self.parseRange(headers.get('range'))
+					if start is not None and not 0 <= start <= stream.frameCount():
+						raise ValueError(f"frame {start} out of range")
+				except ValueError as e:
+					log.info("Invalid Range: %s", e)
+					self.replyRtsp(self.INVALID_RANGE_457, seq)
+					return
+
+				if self.state == self.READY:
+					self.state = self.PLAYING
+
+					# Create a new socket for RTP/UDP
+					self.openRtpSocket()
+					self.clientInfo['rtpSeqNum'] = 0
+					self.clientInfo['rtpHeaders'] = memoryview(bytearray(HEADER_SIZE * FramePacer.BURST))
+				elif start is not None:
+					# seek while playing: stop after the burst being sent, cutting off the
+					# frame in flight, and restart from the new one. The client drops that
+					# frame's packets, which all come before the RTP-Info seq of the reply.
+					self.stopStreaming()
+				else:
+					# nothing to change; confirm where the stream is
+					self.replyRtsp(self.OK_200, seq, self.playHeaders(filename, unit))
+					return
+
+				if start is not None:
+					stream.seek(start)
+				self.replyRtsp(self.OK_200, seq, self.playHeaders(filename, unit))
 				
-				# Create a new thread and start sending RTP packets
-				self.clientInfo['event'] = threading.Event()
-				self.clientInfo['worker']= threading.Thread(target=self.sendRtp) 
-				self.clientInfo['worker'].start()
-				self.clientInfo['rtpSeqNum'] = 0
+				# Start sending RTP packets
+				self.startStreaming()
 		
 		# Process PAUSE request
 		elif requestType == self.PAUSE:
 			if self.state == self.PLAYING:
-				print("processing PAUSE\n")
+				log.debug("processing PAUSE")
 				self.state = self.READY
 				
-				self.clientInfo['event'].set()
+				self.stopStreaming()
 			
-				self.replyRtsp(self.OK_200, seq[1])
+				self.replyRtsp(self.OK_200, seq)
+
+		# Process SET_PARAMETER request (receiver feedback)
+		elif requestType == self.SET_PARAMETER:
+			if self.state in (self.READY, self.PLAYING):
+				self.receiverReport(request.parameters())
+				self.replyRtsp(self.OK_200, seq)
+
+		# Process GET_PARAMETER request (keep-alive; no parameters to report)
+		elif requestType == self.GET_PARAMETER:
+			self.replyRtsp(self.OK_200, seq)
+
+		# Process OPTIONS request
+		elif requestType == self.OPTIONS:
+			self.replyRtsp(self.OK_200, seq, [('Public', ', '.join(self.METHODS))])
 		
 		# Process TEARDOWN request
 		elif requestType == self.TEARDOWN:
-			print("processing TEARDOWN\n")
+			log.debug("processing TEARDOWN")
 
-			self.clientInfo['event'].set()
+			self.stopStreaming()
 			
-			self.replyRtsp(self.OK_200, seq[1])
-			
-			# Close the RTP socket
-			self.clientInfo['rtpSocket'].close()
+			self.replyRtsp(self.OK_200, seq)
+
+			# Close the RTP and RTCP sockets and release the video files
+			self.releaseSession()
+
+		# Any other method (DESCRIBE, ANNOUNCE, RECORD...): say which ones are served
+		else:
+			self.replyRtsp(self.METHOD_NOT_ALLOWED_405, seq, [('Public', ', '.join(self.METHODS))])
 
 		
-	def replyRtsp(self, code, seq):
-		"""Send RTSP reply to the client."""
+	def admitSetup(self, headers, seq):
+		"""Get the client's RTP port for a SETUP and count the new session.
+
+		Replies with the error and returns None if the Transport header is
+		unusable or MAX_SESSIONS are already active.
+		"""
+		# the client's RTP port, from the Transport header
+		rtpPort = self.parseTransport(headers.get('transport'))
+		if rtpPort is None:
+			self.replyRtsp(self.UNSUPPORTED_TRANSPORT_461, seq)
+			return None
+
+		# refuse a session over the limit rather than slow every stream down
+		if not self.startSession():
+			self.replyRtsp(self.NOT_ENOUGH_BANDWIDTH_453, seq)
+			return None
+		return rtpPort
+
+	def openStream(self, filename):
+		"""Open a SETUP's file, indexing it on first use; raises IOError if it cannot be read."""
+		return VideoStream(filename, useMmap=self.USE_MMAP)
+
+	def completeSetup(self, stream, filename, rtpPort, seq):
+		"""Make the session ready to play the opened stream and reply to the SETUP."""
+		self.clientInfo['videoStream'] = stream
+		self.openRenditions(filename)
+		self.state = self.READY
+
+		# Generate a randomized RTSP session ID
+		self.clientInfo['session'] = randint(100000, 999999)
+		# and a random SSRC for the session's RTP stream (RFC 3550 8.1)
+		self.clientInfo['ssrc'] = randint(1, 0xFFFFFFFF)
+		# RTP timestamps start from a random value too (RFC 3550 5.1)
+		self.clientInfo['rtpBase'] = randint(0, 0xFFFFFFFF)
+
+		# Send RTSP reply
+		self.replyRtsp(self.OK_200, seq)
+
+		self.clientInfo['rtpPort'] = rtpPort
+
+		# RTCP goes to and from the next port up
+		self.openRtcpSocket()
+
+	def replyRtsp(self, code, seq, headers=()):
+		"""Send RTSP reply to the client, with extra (name, value) header fields."""
 		if code == self.OK_200:
 
-			reply = 'RTSP/1.0 200 OK\nCSeq: ' + seq + '\nSession: ' + str(self.clientInfo['session'])
-			print(reply)
-			connSocket = self.clientInfo['rtspSocket'][0]
-			connSocket.send(reply.encode())
+			reply = RtspMessage.response(200, [('CSeq', seq)] + self.sessionHeader() + list(headers))
+			log.debug("%s", reply)
+			self.sendRtspReply(reply)
 		
 		# Error messages
 		elif code == self.FILE_NOT_FOUND_404:
-			print("404 NOT FOUND")
+			log.warning("404 NOT FOUND")
+			self.sendRtspReply(RtspMessage.response(404, [('CSeq', seq)]))
 		elif code == self.CON_ERR_500:
-			print("500 CONNECTION ERROR")
+			log.warning("500 CONNECTION ERROR")
+		elif code == self.INVALID_RANGE_457:
+			log.info("457 INVALID RANGE")
+			self.sendRtspReply(RtspMessage.response(457, [('CSeq', seq)] + self.sessionHeader()))
+		elif code == self.UNSUPPORTED_TRANSPORT_461:
+			log.info("461 UNSUPPORTED TRANSPORT")
+			self.sendRtspReply(RtspMessage.response(461, [('CSeq', seq)]))
+		elif code == self.NOT_ENOUGH_BANDWIDTH_453:
+			log.warning("453 NOT ENOUGH BANDWIDTH: %d sessions active", len(self.sessions))
+			self.sendRtspReply(RtspMessage.response(453, [('CSeq', seq)]))
+		elif code == self.METHOD_NOT_ALLOWED_405:
+			log.info("405 METHOD NOT ALLOWED")
+			self.sendRtspReply(RtspMessage.response(405, [('CSeq', seq)] + list(headers)))
 
-	def sendRtp(self):
-			"""Send RTP packets over UDP."""
-			rtpSocket = self.clientInfo['rtpSocket']
+	def sessionHeader(self):
+		"""The Session header field of a reply, with the timeout clients must send keep-alives within."""
+		if 'session' not in self.clientInfo:
+			return []
+		return [('Session', f"{self.clientInfo['session']};timeout={self.SESSION_TIMEOUT}")]
 
-			address = self.clientInfo['rtspSocket'][1][0]
-			rtpPort = int(self.clientInfo['rtpPort'])
-			
+	def parseTransport(self, value):
+		"""Get the client_port of a SETUP Transport header (its first port if a range), or None."""
+		for field in (value or '').split(';'):
+			name, sep, port = field.partition('=')
+			if sep and name.strip().lower() == 'client_port':
+				port = port.strip().split('-', 1)[0]
+				if port.isascii() and port.isdigit() and 0 < int(port) < 65535:
+					return int(port)
+		return None
+
+	def parseRange(self, value):
+		"""Parse a PLAY Range header: npt=SECONDS- ([h:]m:s also accepted) or frame=N-.
+
+		Returns (unit, start frame); the frame is None without a header or
+		for npt=now-. Raises ValueError if the header cannot be used.
+		"""
+		if value is None:
+			return 'npt', None
+		unit, sep, spec = value.partition('=')
+		unit = unit.strip().lower()
+		if not sep or unit not in ('npt', 'frame'):
+			raise ValueError(f"unsupported range {value!r}")
+		start = spec.split('-', 1)[0].strip()
+		if unit == 'frame':
+			return unit, int(start)
+		if start in ('', 'now'):
+			return unit, None
+		seconds = 0.0
+		for part in start.split(':'):
+			seconds = seconds * 60 + float(part)
+		if not math.isfinite(seconds) or seconds < 0:
+			raise ValueError(f"invalid start {value!r}")
+		return unit, round(seconds * self.frameRate())
+
+	def playHeaders(self, filename, unit):
+		"""Range and RTP-Info header fields of a PLAY reply."""
+		frame = self.clientInfo['videoStream'].frameNbr()
+		if unit == 'frame':
+			position = f"frame={frame}-"
+		else:
+			position = f"npt={frame / self.frameRate():.3f}-"
+		rtpInfo = f"url={filename};seq={self.clientInfo['rtpSeqNum'] & 0xFFFF};rtptime={self.rtpTimestamp()}"
+		return [('Range', position), ('RTP-Info', rtpInfo)]
+
+	def sendRtspReply(self, reply):
+		"""Write an RTSP reply (an RtspMessage) to the control connection."""
+		connSocket = self.clientInfo['rtspSocket'][0]
+		connSocket.sendall(reply.encode())
+
+	def clientAddress(self):
+		"""Get the client's IP address (RTP destination)."""
+		return self.clientInfo['rtspSocket'][1][0]
+
+	def openRtpSocket(self):
+		"""Create the UDP socket RTP packets are sent from."""
+		self.clientInfo["rtpSocket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+	def closeRtpSocket(self):
+		"""Close the RTP socket."""
+		if 'rtpSocket' in self.clientInfo:
+			self.clientInfo['rtpSocket'].close()
+
+	def openRtcpSocket(self):
+		"""Create the UDP socket sender reports go out of and receiver reports come back to."""
+		rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		rtcpSocket.bind(('', 0))
+		rtcpSocket.setblocking(False)
+		if SO_TIMESTAMP is not None:
+			try:
+				# kernel arrival times, so RTT does not include the wait until the sender reads the report
+				rtcpSocket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMP, 1)
+			except OSError:
+				pass
+		self.clientInfo['rtcpSocket'] = rtcpSocket
+		self.clientInfo['rtcp'] = {'packets': 0, 'octets': 0, 'nextReport': 0.0, 'reports': 0,
+			'rtt': None, 'fractionLost': None, 'cumulativeLost': None, 'jitter': None, 'highestSeq': None}
+
+	def closeRtcpSocket(self):
+		"""Close the RTCP socket."""
+		if 'rtcpSocket' in self.clientInfo:
+			self.clientInfo['rtcpSocket'].close()
+
+	def startStreaming(self):
+		"""Start sending RTP packets from the shared send scheduler."""
+		rtpSocket = self.clientInfo['rtpSocket']
+		destination = (self.clientAddress(), int(self.clientInfo['rtpPort']))
+		# each burst goes out in one segmented sendmsg where the kernel supports it
+		self.clientInfo['sender'] = self.rtpSender(UdpBatchSender(rtpSocket, destination).send)
+		SendScheduler.shared().schedule(self, monotonic())
+
+	def stopStreaming(self):
+		"""Stop the RTP sender."""
+		if 'sender' in self.clientInfo:
+			SendScheduler.shared().cancel(self)
+
+	def sendDue(self):
+		"""Send the next burst of RTP packets; return when the following one is due."""
+		return next(self.clientInfo['sender'])
+
+	def rtpSender(self, sendBurst):
+		"""Send frames paced against the media clock.
+
+		A generator: after each burst it yields the monotonic time the
+		next burst is due, and the caller resumes it then. sendBurst gets
+		a list of (header, payload) views and returns (sent, failed).
+		"""
+		pacer = FramePacer(self.frameRate())
+		frame = self.clientInfo['videoStream'].frameNbr()
+		pacer.reset(frame)
+
+		while True:
+			readStart = perf_counter()
+			frame, fragments = self.readPacedFrame(pacer, frame, monotonic())
+			self.frameReadLatency.observe(perf_counter() - readStart)
+			if fragments and self.canSendFrame():
+				packets = self.packetize(fragments, self.rtpTimestamp(frame))
+				sent = errors = 0
+				for start, end, due in pacer.bursts(frame, len(fragments)):
+					if due > monotonic():
+						yield due
+					burst = list(islice(packets, end - start))
+					sendStart = perf_counter()
+					burstSent, burstErrors = sendBurst(burst)
+					self.sendLatency.observe(perf_counter() - sendStart)
+					sent += burstSent
+					errors += burstErrors
+				size = sum(len(payload) for payload, marker in fragments)
+				self.framesSent.inc()
+				self.packetsSent.inc(sent)
+				self.bytesSent.inc(size)
+				if errors:
+					self.sendErrors.inc(errors)
+					# once per session; the counter has the rest
+					logSendError = log.debug if self.clientInfo.get('sendErrorLogged') else log.warning
+					self.clientInfo['sendErrorLogged'] = True
+					logSendError("Connection Error: %d of %d packets not sent to %s", errors, len(fragments), self.clientAddress())
+				self.serviceRtcp(sent, size, pacer.position(monotonic()))
+			frame += 1
+			yield pacer.deadline(frame)
+
+	def serviceRtcp(self, packets, octets, position):
+		"""Count sent RTP, read the client's receiver reports and send a sender report when one is due.
+
+		position is the media position now, in (fractional) frames; it
+		gives the sender report's RTP timestamp.
+		"""
+		rtcp = self.clientInfo.get('rtcp')
+		if rtcp is None:
+			return
+		rtcp['packets'] += packets
+		rtcp['octets'] += octets
+		rtcpSocket = self.clientInfo['rtcpSocket']
+		while True:
+			try:
+				data, ancdata, flags, address = rtcpSocket.recvmsg(2048, socket.CMSG_SPACE(16))
+			except (BlockingIOError, InterruptedError):
+				break
+			except OSError:
+				# ICMP port unreachable from a client without RTCP, or the socket closed
+				return
+			arrival = None
+			for level, kind, cmsg in ancdata:
+				if level == socket.SOL_SOCKET and kind == SO_TIMESTAMP and len(cmsg) >= 16:
+					seconds, micros = struct.unpack('=qq', cmsg[:16])
+					arrival = seconds + micros / 1e6
+			self.receiveRtcp(data, arrival)
+		now = monotonic()
+		if now < rtcp['nextReport']:
+			return
+		rtcp['nextReport'] = now + self.RTCP_INTERVAL
+		ssrc = self.clientInfo['ssrc']
+		report = RtcpPacket.compound(
+			RtcpPacket.senderReport(ssrc, ntpTime(), self.rtpTimestamp(position), rtcp['packets'], rtcp['octets']),
+			RtcpPacket.sourceDescription(ssrc, f"server@{socket.gethostname()}"))
+		try:
+			rtcpSocket.sendto(report, (self.clientAddress(), int(self.clientInfo['rtpPort']) + 1))
+		except OSError as e:
+			if e.errno not in (errno.EAGAIN, errno.ECONNREFUSED):
+				log.warning("RTCP send error: %s", e)
+
+	def receiveRtcp(self, data, arrival=None):
+		"""Take the client's report on this session's stream from an RTCP datagram received at arrival (wall clock)."""
+		try:
+			packets = RtcpPacket.decodeCompound(data)
+		except ValueError:
+			return
+		rtcp = self.clientInfo['rtcp']
+		for packet in packets:
+			if packet.packetType not in (RTCP_RR, RTCP_SR):
+				continue
+			for block in packet.reports:
+				if block.ssrc != self.clientInfo['ssrc']:
+					continue
+				rtcp['reports'] += 1
+				# a receiver report keeps the session alive as well as a request
+				self.clientInfo['lastActivity'] = monotonic()
+				rtt = roundTrip(block, arrival)
+				if rtt is not None:
+					rtcp['rtt'] = rtt
+				rtcp['fractionLost'] = block.fractionLost / 256
+				rtcp['cumulativeLost'] = block.cumulativeLost
+				rtcp['jitter'] = block.jitter / self.RTP_CLOCK_RATE
+				rtcp['highestSeq'] = block.highestSeq
+
+	def rtcpStats(self):
+		"""Get the session's RTCP view of the stream.
+
+		packets and octets sent, and from the client's latest receiver
+		report: rtt and jitter in seconds, fractionLost (0..1),
+		cumulativeLost and highestSeq; None until a report has arrived.
+		"""
+		rtcp = dict(self.clientInfo.get('rtcp') or {})
+		rtcp.pop('nextReport', None)
+		return rtcp
+
+	def canSendFrame(self):
+		"""Whether the transport can take another frame now."""
+		return True
+
+	def frameRate(self):
+		"""Get the frame rate to stream at: the configured one, else the file's."""
+		return self.FRAME_RATE or self.clientInfo['videoStream'].frameRate()
+
+	def readPacedFrame(self, pacer, frame, now):
+		"""Read the frame to send at `now`, skipping ahead if the sender fell behind.
+
+		Returns (frame number, fragments); fragments is None past the end of the stream.
+		"""
+		source = self.clientInfo['videoStream']
+		# a rendition switch takes effect here, between two frames
+		stream = self.clientInfo['streams'][self.clientInfo['level']]
+		due = pacer.catchUp(frame, now)
+		if due != frame:
+			self.framesSkipped.inc(due - frame)
+			frame = due
+		stream.seek(min(frame, stream.frameCount()))
+		fragments = self.nextFragments(stream)
+		if stream is not source:
+			# renditions are frame for frame, so the position carries over
+			source.seek(stream.frameNbr())
+		return frame, fragments
+
+	def openRenditions(self, filename):
+		"""Find the renditions the session may switch to; it starts on the source file."""
+		renditions = Renditions.available(filename) if self.ADAPTIVE else [filename]
+		self.clientInfo['renditions'] = renditions
+		self.clientInfo['streams'] = {0: self.clientInfo['videoStream']}
+		self.clientInfo['level'] = 0
+		self.clientInfo['rateController'] = RateController(len(renditions))
+
+	def receiverReport(self, params):
+		"""Pick the rendition to stream from the client's loss and buffer report."""
+		if 'rateController' not in self.clientInfo:
+			return
+		try:
+			loss = float(params.get('loss', 0))
+			buffered = int(params['buffer']) if 'buffer' in params else None
+		except ValueError:
+			return
+		stalled = params.get('stalled') == '1'
+		level = self.clientInfo['rateController'].update(loss, buffered, stalled)
+		if level != self.clientInfo['level']:
+			self.switchRendition(level)
+
+	def switchRendition(self, level):
+		"""Stream from another rendition from the next frame on, opening it on first use."""
+		streams = self.clientInfo['streams']
+		path = self.clientInfo['renditions'][level]
+		if level not in streams:
+			try:
+				stream = VideoStream(path, useMmap=self.USE_MMAP)
+			except IOError:
+				stream = None
+			if stream is not None and stream.frameCount() != streams[0].frameCount():
+				log.warning("Rendition %s does not match %s; regenerate it", path, self.clientInfo['renditions'][0])
+				stream.close()
+				stream = None
+			if stream is None:
+				# keep the controller within the renditions that work
+				controller = self.clientInfo['rateController']
+				del self.clientInfo['renditions'][level:]
+				controller.levels = level
+				controller.level = self.clientInfo['level']
+				return
+			streams[level] = stream
+		log.info("Session %s switching to rendition %d: %s", self.clientInfo['session'], level, path)
+		self.clientInfo['level'] = level
+		self.renditionSwitches.inc()
+
+	def closeStreams(self):
+		"""Close the session's source file and the renditions it opened."""
+		streams = self.clientInfo.get('streams') or {0: self.clientInfo['videoStream']}
+		for stream in streams.values():
+			stream.close()
+
+	def releaseSession(self):
+		"""Stop streaming and free the session's sockets and files; the RTSP connection stays open."""
+		self.stopStreaming()
+		# the sender refers back to the worker and holds frames of the mapped file
+		self.clientInfo.pop('sender', None)
+		self.closeRtpSocket()
+		self.closeRtcpSocket()
+		if 'videoStream' in self.clientInfo:
+			self.closeStreams()
+		self.endSession()
+		self.state = self.INIT
+
+	def nextFragments(self, stream):
+		"""Read the stream's next frame as (payload, marker) fragments.
+
+		Frames of the same file are cut once per process and shared through
+		the packet cache. Returns None past the end of the stream.
+		"""
+		n = stream.frameNbr()
+		fileKey = stream.mediaKey()
+		cache = PacketCache.shared()
+		key = (fileKey, n, self.MAX_PAYLOAD_SIZE)
+		fragments = cache.get(key) if fileKey is not None else None
+		if fragments is not None:
+			stream.seek(n + 1)
+			return fragments
+		data = stream.nextFrame()
+		if data is None:
+			return None
+		fragments = PacketCache.fragment(data, self.MAX_PAYLOAD_SIZE)
+		if fileKey is not None:
+			cache.put(key, fragments)
+			self.cacheMisses.inc()
+		return fragments
+
+	def packetize(self, fragments, timestamp):
+		"""Build the RTP packets of a fragmented frame with the frame's RTP timestamp.
+
+		Yields (header, payload) per packet without copying the payload.
+		Headers are packed into a per-session ring of FramePacer.BURST
+		slots, so a header stays valid until that many more packets have
+		been generated.
+		"""
+		headers = self.clientInfo['rtpHeaders']
+		slots = len(headers) // HEADER_SIZE
+
+		for payload, marker in fragments:
+			seqnum = self.clientInfo['rtpSeqNum']
+			self.clientInfo['rtpSeqNum'] += 1
+
+			slot = (seqnum % slots) * HEADER_SIZE
+			RTP_HEADER.pack_into(headers, slot, 0x80, marker << 7 | self.RTP_PAYLOAD_TYPE,
+				seqnum & 0xFFFF, timestamp & 0xFFFFFFFF, self.clientInfo['ssrc'])
+			yield headers[slot:slot + HEADER_SIZE], payload
+
+	def rtpTimestamp(self, frame=None):
+		"""Get the RTP timestamp of a frame (by default the next one to send).
+
+		Timestamps run on the RTP_CLOCK_RATE media clock from the frame
+		number and frame rate, offset by the session's random base, so a
+		frame's timestamp does not depend on when it is sent. frame may be
+		fractional, for an instant between two frames.
+		"""
+		if frame is None:
+			frame = self.clientInfo['videoStream'].frameNbr()
+		ticks = round(frame * self.RTP_CLOCK_RATE / self.frameRate())
+		return (self.clientInfo.get('rtpBase', 0) + ticks) & 0xFFFFFFFF
+
+	def startSession(self):
+		"""Count a new session as active; return False if MAX_SESSIONS are already."""
+		with self.sessionLock:
+			if self.MAX_SESSIONS is not None and len(self.sessions) >= self.MAX_SESSIONS:
+				self.sessionsRejected.inc()
+				return False
+			self.sessions.add(self)
+		self.sessionsStarted.inc()
+		self.sessionsActive.inc()
+		return True
+
+	def endSession(self):
+		"""Stop counting the session as active (once, however it ends)."""
+		with self.sessionLock:
+			if self not in self.sessions:
+				return
+			self.sessions.discard(self)
+		self.sessionsActive.dec()
+
+	def connected(self):
+		"""Start tracking the RTSP connection for the idle reaper."""
+		self.clientInfo['lastActivity'] = monotonic()
+		with self.sessionLock:
+			self.connections.add(self)
+		self.connectionsOpen.inc()
+
+	def closeConnection(self):
+		"""Release the session and close the RTSP connection (once, however it ends)."""
+		self.releaseSession()
+		with self.sessionLock:
+			if self not in self.connections:
+				return
+			self.connections.discard(self)
+		self.connectionsOpen.dec()
+		self.closeRtspSocket()
+		log.info("Client %s disconnected", self.clientAddress())
+
+	def closeRtspSocket(self):
+		"""Close the RTSP connection."""
+		try:
+			self.clientInfo['rtspSocket'][0].close()
+		except OSError:
+			pass
+
+	def expire(self):
+		"""Make the connection's reader see end of stream, so it tears the session down."""
+		try:
+			self.clientInfo['rtspSocket'][0].shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+
+	@classmethod
+	def reapIdle(cls):
+		"""Expire connections with no request or RTCP report for SESSION_TIMEOUT seconds."""
+		now = monotonic()
+		for worker in list(cls.connections):
+			info = worker.clientInfo
+			idle = now - info.get('lastActivity', now)
+			if idle <= cls.SESSION_TIMEOUT or info.get('expired'):
+				continue
+			info['expired'] = True
+			log.info("Session %s from %s idle for %.0f s; tearing it down", info.get('session', '-'), worker.clientAddress(), idle)
+			cls.sessionsExpired.inc()
+			worker.expire()
+
+	@classmethod
+	def startReaper(cls):
+		"""Check for idle connections every REAP_INTERVAL seconds, in a background thread."""
+		def reap():
 			while True:
-				self.clientInfo['event'].wait(0.05) 
-				
-				if self.clientInfo['event'].isSet(): 
-					break 
-				data = self.clientInfo['videoStream'].nextFrame()
-				if data: 
-					# FRAGMENTATION
-					frameNumber = self.clientInfo['videoStream'].frameNbr()
-					
-					# get timestamp
-					current_timestamp = int(time())
-					
-					payload = data
-					size = len(payload)
-					offset = 0
-					
-					# Cut frame
-					while offset < size:
-						chunk = payload[offset : offset + self.MAX_PAYLOAD_SIZE]
-						offset += len(chunk)
-						
-						if offset >= size:
-							marker = 1
-						else:
-							marker = 0
-
-						seqnum = self.clientInfo['rtpSeqNum']
-						self.clientInfo['rtpSeqNum'] += 1
-						
-						try:
-							# send packet
-							packet = self.makeRtp(chunk, seqnum, current_timestamp, marker)
-							rtpSocket.sendto(packet, (address, rtpPort))
-						except:
-							print("Connection Error")
+				sleep(cls.REAP_INTERVAL)
+				cls.reapIdle()
+		threading.Thread(target=reap, name="session-reaper", daemon=True).start()
 
+	@classmethod
+	def collectSessions(cls, add):
+		"""Add per-session samples to a metrics snapshot."""
+		for worker in list(cls.sessions):
+			labels = f'session="{worker.clientInfo.get("session")}"'
+			stats = worker.rtcpStats()
+			add('counter', 'session_packets_sent_total', "RTP packets sent to the session", labels, stats.get('packets', 0))
+			add('counter', 'session_bytes_sent_total', "RTP payload bytes sent to the session", labels, stats.get('octets', 0))
+			add('gauge', 'session_rendition', "Rendition the session streams (0 is the source file)",
+				labels, worker.clientInfo.get('level', 0))
+			for name, key, help in (('session_rtt_seconds', 'rtt', "Round-trip time from the latest RTCP receiver report"),
+					('session_jitter_seconds', 'jitter', "Interarrival jitter the client reports"),
+					('session_fraction_lost', 'fractionLost', "Fraction of packets lost in the client's last report interval")):
+				if stats.get(key) is not None:
+					add('gauge', name, help, labels, stats[key])
 
 	def makeRtp(self, payload, seqnum, timestamp, marker):
 		"""RTP-packetize the video data."""
@@ -185,10 +772,12 @@ class ServerWorker:
 		padding = 0
 		extension = 0
 		cc = 0
-		pt = 26 
-		ssrc = 1111 
+		pt = self.RTP_PAYLOAD_TYPE
+		ssrc = self.RTP_SSRC
 		rtpPacket = RtpPacket()
 		# Encode the packet with the provided header fields and payload
 		rtpPacket.encode(version, padding, extension, cc, seqnum, marker, pt, ssrc, timestamp, payload)
 		# Return the packet as a byte stream to be sent over UDP
-		return rtpPacket.getPacket()
\ No newline at end of file
+		return rtpPacket.getPacket()
+
+ServerWorker.metrics.collect(ServerWorker.collectSessions)
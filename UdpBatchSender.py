@@ -0,0 +1,80 @@
+import sys, socket, struct, errno
+
+# Linux UDP generic segmentation offload (GSO), kernel 4.18+
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65507
+# errors meaning the socket or device cannot segment for us
+GSO_UNSUPPORTED = {errno.EIO, errno.EINVAL, errno.ENOPROTOOPT, errno.EOPNOTSUPP}
+
+class UdpBatchSender:
+	"""Send a batch of datagrams to one destination in as few syscalls as possible.
+
+	On Linux every run of equal-sized packets goes out in one sendmsg with a
+	UDP_SEGMENT control message and the kernel cuts it into datagrams. If
+	the kernel or device refuses, the sender falls back to one sendmsg (or
+	sendto) per packet for the rest of the process.
+	"""
+	useGso = sys.platform.startswith('linux') and hasattr(socket.socket, 'sendmsg')
+	useSendmsg = hasattr(socket.socket, 'sendmsg')
+
+	def __init__(self, sock, destination):
+		self.sock = sock
+		self.destination = destination
+
+	def send(self, packets):
+		"""Send (header, payload) pairs; return (packets sent, packets failed)."""
+		if UdpBatchSender.useGso:
+			return self.sendSegmented(packets)
+		return self.sendEach(packets)
+
+	def sendSegmented(self, packets):
+		"""One sendmsg per group of segments the kernel can split itself."""
+		sent = errors = 0
+		start = 0
+		while start < len(packets):
+			header, payload = packets[start]
+			segment = len(header) + len(payload)
+			end = start + 1
+			total = segment
+			# all segments but the last of a group must have the same size
+			while (end < len(packets) and end - start < GSO_MAX_SEGMENTS
+					and total + segment <= GSO_MAX_BYTES):
+				size = len(packets[end][0]) + len(packets[end][1])
+				if size > segment:
+					break
+				end += 1
+				total += size
+				if size < segment:
+					break
+			buffers = [buf for packet in packets[start:end] for buf in packet]
+			if end - start == 1:
+				ancillary = ()
+			else:
+				ancillary = [(SOL_UDP, UDP_SEGMENT, struct.pack('=H', segment))]
+			try:
+				self.sock.sendmsg(buffers, ancillary, 0, self.destination)
+				sent += end - start
+			except OSError as e:
+				if ancillary and e.errno in GSO_UNSUPPORTED:
+					UdpBatchSender.useGso = False
+					restSent, restErrors = self.sendEach(packets[start:])
+					return sent + restSent, errors + restErrors
+				errors += end - start
+			start = end
+		return sent, errors
+
+	def sendEach(self, packets):
+		"""One syscall per packet."""
+		sent = errors = 0
+		for header, payload in packets:
+			try:
+				if self.useSendmsg:
+					self.sock.sendmsg((header, payload), (), 0, self.destination)
+				else:
+					self.sock.sendto(b''.join((header, payload)), self.destination)
+				sent += 1
+			except OSError:
+				errors += 1
+		return sent, errors
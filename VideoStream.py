@@ -1,61 +1,370 @@
+import os, re, sys, struct, mmap, threading
+from array import array
+from bisect import bisect_left
+
+from PacketCache import PacketCache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# MJPEG carries no timing; stream at the rate the sample files were made for
+DEFAULT_FRAME_RATE = 20
+
+INDEX_EXT = '.idx'
+INDEX_MAGIC = b'VSIX'
+INDEX_VERSION = 1
+# magic, version, media file size, media mtime (ns), frame count
+INDEX_HEADER = struct.Struct('<4sHQqI')
+
+# 0xFF followed by a byte that makes it a marker (not stuffing, RSTn or fill)
+MARKER_RE = re.compile(rb'\xff(?=[^\x00\xd0-\xd7\xff])')
+
 class VideoStream:
-    def __init__(self, filename):
+    def __init__(self, filename, useMmap=False):
         self.filename = filename
         try:
             self.file = open(filename, 'rb')
         except:
             raise IOError
         self.frameNum = 0
-        
-    # def nextFrame(self):
-    # 	"""Get next frame."""
-    # 	data = self.file.read(5) # Get the framelength from the first 5 bits
-    # 	if data: 
-    # 		framelength = int(data)
-                            
-    # 		# Read the current frame
-    # 		data = self.file.read(framelength)
-    # 		self.frameNum += 1
-    # 	return data
+        self.media = MediaFile.acquire(filename, self.file)
+        self.offsets, self.lengths = self.media.offsets, self.media.lengths
+        # in mmap mode frames are memoryview slices of the shared mapping
+        self.view = self.media.mapping(self.file) if useMmap else None
+        if self.view is not None:
+            self.file.close()
+            self.file = None
+
     def nextFrame(self):
         """Get next frame."""
+        data = self.getFrame(self.frameNum)
+        if data is not None:
+            self.frameNum += 1
+        return data
 
-        current_pos = self.file.tell()
-        ## sample mjpeg file
-        try:
-            header = self.file.read(5)
-            if len(header) == 5 and header.isdigit():
-
-                framelength = int(header)
-                data = self.file.read(framelength)
-                self.frameNum += 1
-                return data
-        except ValueError:
-            pass
-        ## standard mjpeg file
-        self.file.seek(current_pos)
-        
-        data = b''
+    def getFrame(self, n):
+        """Get frame n (0-based) without moving the read position."""
+        if n < 0 or n >= len(self.offsets):
+            return None
+        offset, length = self.offsets[n], self.lengths[n]
+        if self.view is not None:
+            return self.view[offset:offset + length]
+        if self.file is None:
+            # closed while a sender was still reading
+            return None
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def seek(self, n):
+        """Make frame n (0-based) the next frame returned by nextFrame."""
+        if n < 0 or n > len(self.offsets):
+            raise IndexError(f"frame {n} out of range (0..{len(self.offsets)})")
+        self.frameNum = n
+
+    def frameCount(self):
+        """Get total number of frames."""
+        return len(self.offsets)
 
-        while True:
-            chunk = self.file.read(4096)
-            if not chunk:
-                break         
-            data += chunk
-            end_marker = b'\xff\xd9'
-            eoi_pos = data.find(end_marker)
-            
-            if eoi_pos != -1:
-                frame_end = eoi_pos + 2 
-                frame_data = data[:frame_end]
-        
-                next_frame_pos = current_pos + frame_end
-                self.file.seek(next_frame_pos)
-                
-                self.frameNum += 1
-                return frame_data
-
-        return None
     def frameNbr(self):
         """Get frame number."""
-        return self.frameNum
\ No newline at end of file
+        return self.frameNum
+
+    def frameRate(self):
+        """Get the nominal frame rate in frames per second."""
+        return DEFAULT_FRAME_RATE
+
+    def mediaKey(self):
+        """Get the key identifying the file's contents, or None once closed."""
+        return self.media.key if self.media is not None else None
+
+    def close(self):
+        """Close the media file and drop this stream's share of it."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.media is not None:
+            self.view = None
+            self.media.release()
+            self.media = None
+
+
+_mediaLock = threading.Lock()
+_mediaFiles = {}
+
+class MediaFile:
+    """Frame index and memory map of one media file, shared by all its streams."""
+    # sidecar indexes are only written for media under this directory (None: anywhere)
+    INDEX_ROOT = None
+
+    @classmethod
+    def acquire(cls, filename, file):
+        """Get the shared entry for an open media file, creating it on first use."""
+        st = os.fstat(file.fileno())
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with _mediaLock:
+            media = _mediaFiles.get(key)
+            if media is not None:
+                media.refs += 1
+                return media
+        # index outside the lock so a slow scan does not stall other SETUPs
+        media = cls(filename, file, st, key)
+        with _mediaLock:
+            media = _mediaFiles.setdefault(key, media)
+            media.refs += 1
+            return media
+
+    def __init__(self, filename, file, st, key):
+        self.filename = filename
+        self.key = key
+        self.refs = 0
+        self.map = None
+        self.view = None
+        self.offsets, self.lengths = self.loadIndex(file, st)
+
+    def mapping(self, file):
+        """Get a memoryview of the whole file, mapping the open file on first use."""
+        with _mediaLock:
+            if self.view is None:
+                try:
+                    self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    # empty file or no mmap support: fall back to file reads
+                    return None
+                self.view = memoryview(self.map)
+            return self.view
+
+    def release(self):
+        """Drop one reference; unmap the file when the last stream closes."""
+        with _mediaLock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+            if _mediaFiles.get(self.key) is self:
+                del _mediaFiles[self.key]
+            view, mapping = self.view, self.map
+            self.view = self.map = None
+        # cached packets may hold slices of the mapping
+        PacketCache.discardShared(self.key)
+        if mapping is not None:
+            view.release()
+            try:
+                mapping.close()
+            except BufferError:
+                # frames still referenced by a sender; unmapped once they are freed
+                pass
+
+    # ------------------------------------------------------------
+    # Frame index
+    # ------------------------------------------------------------
+    def indexFilename(self):
+        """Get the path of the sidecar index file."""
+        return self.filename + INDEX_EXT
+
+    def loadIndex(self, file, st):
+        """Load the sidecar frame index, rebuilding it if missing or stale."""
+        index = self.readIndex(st)
+        if index is None:
+            index = self.buildIndex(file)
+            if self.mayWriteIndex():
+                self.writeIndex(st, *index)
+        return index
+
+    def mayWriteIndex(self):
+        """Tell whether the media file lies under INDEX_ROOT, so its index may be saved next to it."""
+        if self.INDEX_ROOT is None:
+            return True
+        root = os.path.realpath(self.INDEX_ROOT)
+        path = os.path.realpath(self.filename)
+        return os.path.commonpath([root, path]) == root
+
+    def readIndex(self, st):
+        """Read the sidecar index; return None if it does not match the media file."""
+        try:
+            with open(self.indexFilename(), 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return None
+        if len(raw) < INDEX_HEADER.size:
+            return None
+        magic, version, size, mtime, count = INDEX_HEADER.unpack_from(raw)
+        if (magic != INDEX_MAGIC or version != INDEX_VERSION
+                or size != st.st_size or mtime != st.st_mtime_ns):
+            return None
+        offsets, lengths = array('Q'), array('I')
+        body = memoryview(raw)[INDEX_HEADER.size:]
+        if len(body) != count * (offsets.itemsize + lengths.itemsize):
+            return None
+        split = count * offsets.itemsize
+        offsets.frombytes(body[:split])
+        lengths.frombytes(body[split:])
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+            lengths.byteswap()
+        return offsets, lengths
+
+    def writeIndex(self, st, offsets, lengths):
+        """Save the index next to the media file (best effort, atomic replace)."""
+        path = self.indexFilename()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, st.st_size, st.st_mtime_ns, len(offsets))
+        if sys.byteorder != 'little':
+            offsets, lengths = array('Q', offsets), array('I', lengths)
+            offsets.byteswap()
+            lengths.byteswap()
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(header)
+                f.write(offsets.tobytes())
+                f.write(lengths.tobytes())
+            os.replace(tmp, path)
+        except OSError:
+            # read-only media directory: keep the index in memory only
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def buildIndex(self, file):
+        """Scan the whole file once and record (offset, length) of every frame."""
+        offsets, lengths = array('Q'), array('I')
+        for offset, length in FrameScanner(file).frames():
+            offsets.append(offset)
+            lengths.append(length)
+        return offsets, lengths
+
+
+class FrameScanner:
+    """Single-pass frame boundary scanner for length-prefixed and standard MJPEG.
+
+    The file is read in large blocks and every block is searched once for
+    JPEG marker positions (NumPy-vectorized when available, a C regex
+    otherwise). Frames are then delimited by walking the JPEG segment
+    structure, so EOI markers inside embedded thumbnails (EXIF APP1) are
+    skipped instead of ending the frame early.
+    """
+    BLOCK_SIZE = 1 << 20
+    NEED_MORE = object()
+
+    def __init__(self, file, blockSize=BLOCK_SIZE, useNumpy=True):
+        self.file = file
+        self.blockSize = blockSize
+        self.useNumpy = useNumpy and numpy is not None
+        self.buf = bytearray()
+        self.base = 0           # file offset of buf[0]
+        self.scanned = 0        # markers are known for every 0xFF before this offset
+        self.markers = array('Q')
+        self.eof = False
+
+    def frames(self):
+        """Yield (offset, length) for every frame in the file."""
+        self.file.seek(0)
+        pos = 0
+        while True:
+            frame = self.parseFrame(pos)
+            if frame is self.NEED_MORE:
+                self.fill()
+                continue
+            if frame is None:
+                return
+            yield frame
+            pos = frame[0] + frame[1]
+            if pos - self.base >= self.blockSize:
+                self.compact(pos)
+
+    def fill(self):
+        """Append the next block to the buffer and index its markers."""
+        block = self.file.read(self.blockSize)
+        if not block:
+            self.eof = True
+            return
+        self.buf += block
+        self.findMarkers()
+
+    def compact(self, pos):
+        """Drop buffered bytes and markers before pos."""
+        del self.buf[:pos - self.base]
+        del self.markers[:bisect_left(self.markers, pos)]
+        self.base = pos
+
+    def findMarkers(self):
+        """Record offsets of 0xFF bytes that start a real marker in the new data.
+
+        Stuffed 0xFF00, RSTn and fill bytes never delimit segments. The last
+        byte is left for the next block since its successor is still unknown.
+        """
+        start = max(self.scanned, self.base) - self.base
+        stop = len(self.buf) - 1
+        if stop <= start:
+            return
+        if self.useNumpy:
+            data = numpy.frombuffer(self.buf, dtype=numpy.uint8, offset=start)
+            ff = numpy.flatnonzero(data[:-1] == 0xFF)
+            nxt = data[ff + 1]
+            ff = ff[(nxt != 0x00) & (nxt != 0xFF) & ((nxt < 0xD0) | (nxt > 0xD7))]
+            self.markers.frombytes((ff + (self.base + start)).astype(numpy.uint64).tobytes())
+            del data, nxt
+        else:
+            base = self.base
+            self.markers.extend(m.start() + base for m in MARKER_RE.finditer(self.buf, start, stop + 1))
+        self.scanned = self.base + stop
+
+    def parseFrame(self, pos):
+        """Find the frame at or after pos.
+
+        Return (offset, length), None at end of file, or NEED_MORE if the
+        frame continues past the buffered data.
+        """
+        buf, base = self.buf, self.base
+        end = base + len(buf)
+        ## sample mjpeg file: 5 ASCII digits of frame length, then the frame
+        if end - pos < 5 and not self.eof:
+            return self.NEED_MORE
+        header = bytes(buf[pos - base:pos - base + 5])
+        if len(header) == 5 and header.isdigit():
+            framelength = int(header)
+            if pos + 5 + framelength > end and not self.eof:
+                return self.NEED_MORE
+            framelength = min(framelength, end - pos - 5)
+            if framelength > 0:
+                return pos + 5, framelength
+        ## standard mjpeg file: SOI ... EOI
+        soi = buf.find(b'\xff\xd8', pos - base)
+        if soi == -1:
+            return None if self.eof else self.NEED_MORE
+        start = base + soi
+        p = start + 2
+        while True:
+            if p + 4 > end:
+                if not self.eof:
+                    return self.NEED_MORE
+                if p + 2 > end:
+                    return None
+            if buf[p - base] != 0xFF:
+                break
+            marker = buf[p - base + 1]
+            if marker == 0xFF:
+                p += 1                          # fill byte
+            elif marker == 0xD9:
+                return start, p + 2 - start     # EOI
+            elif marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                p += 2                          # standalone marker
+            elif marker == 0xD8 or p + 4 > end:
+                break
+            else:
+                # skip the whole segment, including any embedded thumbnail
+                p += 2 + (buf[p - base + 2] << 8 | buf[p - base + 3])
+                if marker == 0xDA:
+                    # entropy-coded data runs up to the next real marker
+                    i = bisect_left(self.markers, p)
+                    if i == len(self.markers):
+                        if not self.eof:
+                            return self.NEED_MORE
+                        break
+                    p = self.markers[i]
+        # malformed segment structure: fall back to the first EOI
+        eoi = buf.find(b'\xff\xd9', soi + 2)
+        if eoi == -1:
+            return None if self.eof else self.NEED_MORE
+        return start, eoi + 2 - soi
@@ -0,0 +1,135 @@
+from FrameAssembler import FrameAssembler
+
+# seconds between packet arrivals in a replayed trace
+STEP = 0.01
+
+
+def packetize(frames, firstSeq=0):
+    """RTP packets (seq, timestamp, marker, payload) of frames given as (timestamp, packet count)."""
+    packets = []
+    seq = firstSeq
+    for timestamp, count in frames:
+        for i in range(count):
+            packets.append((seq & 0xFFFF, timestamp, i == count - 1, f"{timestamp}.{i};".encode()))
+            seq += 1
+    return packets
+
+
+def frame(timestamp, count):
+    """The (timestamp, data) a whole frame of count packets reassembles to."""
+    return timestamp, b''.join(f"{timestamp}.{i};".encode() for i in range(count))
+
+
+def replay(assembler, trace):
+    """Push a trace STEP seconds apart, then flush; return every frame emitted, in order."""
+    frames = []
+    for n, (seq, timestamp, marker, payload) in enumerate(trace):
+        frames += assembler.push(seq, timestamp, marker, payload, now=n * STEP)
+    return frames + assembler.flush()
+
+
+def test_in_order():
+    frames = [(3000, 3), (6000, 1), (9000, 4)]
+    assembler = FrameAssembler()
+    assert replay(assembler, packetize(frames)) == [frame(*f) for f in frames]
+    assert assembler.stats()['framesCompleted'] == 3
+
+
+def test_out_of_order_within_window():
+    frames = [(3000, 3), (6000, 2), (9000, 3)]
+    trace = packetize(frames)
+    # swap packets inside the first frame and across the second and third
+    trace[1], trace[2] = trace[2], trace[1]
+    trace[4], trace[5] = trace[5], trace[4]
+    assembler = FrameAssembler()
+    assert replay(assembler, trace) == [frame(*f) for f in frames]
+    stats = assembler.stats()
+    assert stats['reordered'] == 2
+    assert stats['lost'] == stats['framesDropped'] == 0
+
+
+def test_first_packets_out_of_order():
+    frames = [(3000, 3)]
+    trace = packetize(frames, firstSeq=100)
+    # the stream starts one packet in; the frame's first packet follows
+    trace[0], trace[1] = trace[1], trace[0]
+    assert replay(FrameAssembler(), trace) == [frame(*f) for f in frames]
+
+
+def test_duplicates_emitted_once():
+    frames = [(3000, 2), (6000, 2)]
+    trace = packetize(frames)
+    p0, p1, p2, p3 = trace
+    # p0 and p2 repeat while their frame is still held, p3 once its frame is out
+    trace = [p0, p0, p1, p2, p2, p3, p3]
+    assembler = FrameAssembler()
+    assert replay(assembler, trace) == [frame(*f) for f in frames]
+    stats = assembler.stats()
+    assert stats['duplicates'] == 2
+    assert stats['late'] == 1
+
+
+def test_lost_packet_drops_only_its_frame():
+    frames = [(3000, 2), (6000, 3)] + [(9000 + 3000 * n, 1) for n in range(10)]
+    trace = packetize(frames)
+    del trace[3]    # middle packet of the frame at 6000
+    assembler = FrameAssembler(maxDelay=0.05)
+    emitted = replay(assembler, trace)
+    assert emitted == [frame(*f) for f in frames if f[0] != 6000]
+    stats = assembler.stats()
+    assert stats['lost'] == 1
+    assert stats['framesDropped'] == 1
+
+
+def test_frame_held_until_max_delay():
+    frames = [(3000, 2), (6000, 1), (9000, 1)]
+    trace = packetize(frames)
+    missing = trace.pop(1)
+    assembler = FrameAssembler(maxDelay=1.0)
+    emitted = []
+    for n, (seq, timestamp, marker, payload) in enumerate(trace):
+        emitted += assembler.push(seq, timestamp, marker, payload, now=n * STEP)
+    # the gap is younger than maxDelay: nothing after it is released yet
+    assert emitted == []
+    emitted += assembler.push(*missing, now=len(trace) * STEP)
+    assert emitted == [frame(*f) for f in frames]
+
+
+def test_late_packet_after_drop_is_ignored():
+    frames = [(3000, 2)] + [(6000 + 3000 * n, 1) for n in range(10)]
+    trace = packetize(frames)
+    missing = trace.pop(1)
+    trace.append(missing)
+    assembler = FrameAssembler(maxDelay=0.05)
+    assert replay(assembler, trace) == [frame(*f) for f in frames[1:]]
+    stats = assembler.stats()
+    assert stats['late'] == 1
+    assert stats['framesDropped'] == 1
+
+
+def test_sequence_wraparound():
+    frames = [(3000, 3), (6000, 4), (9000, 2)]
+    trace = packetize(frames, firstSeq=0xFFFD)
+    assert [seq for seq, *rest in trace][:5] == [0xFFFD, 0xFFFE, 0xFFFF, 0, 1]
+    # reorder across the wrap too
+    trace[2], trace[3] = trace[3], trace[2]
+    assembler = FrameAssembler()
+    assert replay(assembler, trace) == [frame(*f) for f in frames]
+    assert assembler.stats()['resyncs'] == 0
+
+
+def test_restart_resynchronises():
+    before = [(3000, 2), (6000, 2)]
+    after = [(90000, 2), (93000, 1)]
+    trace = packetize(before, firstSeq=40000) + packetize(after, firstSeq=7)
+    assembler = FrameAssembler()
+    assert replay(assembler, trace) == [frame(*f) for f in before + after]
+    assert assembler.stats()['resyncs'] == 1
+
+
+def test_timestamp_change_ends_frame_without_marker():
+    trace = packetize([(3000, 2), (6000, 1)])
+    # a sender that leaves the marker bit clear on the first frame's last packet
+    seq, timestamp, marker, payload = trace[1]
+    trace[1] = (seq, timestamp, False, payload)
+    assert replay(FrameAssembler(), trace) == [frame(3000, 2), frame(6000, 1)]
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from RtspParser import RtspParser, RtspError
+
+# random streams checked per property; each case has its own seed
+CASES = 300
+
+def feedChunks(data, sizes):
+	"""Feed data to a new parser in chunks of the given sizes (cycled); return the messages."""
+	parser = RtspParser()
+	messages = []
+	pos = 0
+	i = 0
+	while pos < len(data):
+		size = sizes[i % len(sizes)]
+		messages += parser.feed(data[pos:pos + size])
+		pos += size
+		i += 1
+	return messages
+
+def randomRtspMessage(rng):
+	"""A random valid message: any method or status, shuffled header case and order, LF or CRLF."""
+	if rng.random() < 0.5:
+		startLine = f"{rng.choice(('SETUP', 'PLAY', 'PAUSE', 'TEARDOWN', 'SET_PARAMETER', 'OPTIONS'))} movie{rng.randint(0, 9)}.Mjpeg RTSP/1.0"
+	else:
+		startLine = f"RTSP/1.0 {rng.choice((200, 400, 404, 454, 457, 461, 503))} Some Reason"
+	headers = [('CSeq', str(rng.randint(0, 1 << 31))), ('Session', str(rng.randint(100000, 999999))),
+		('Range', f"npt={rng.random() * 100:.3f}-"), ('X-Extra', 'a: b; c=d')][:rng.randint(1, 4)]
+	body = bytes(rng.randrange(256) for _ in range(rng.choice((0, 0, 1, 40, 300))))
+	if body:
+		headers.append(('Content-Length', str(len(body))))
+	rng.shuffle(headers)
+	headers = [(name.upper() if rng.random() < 0.2 else name, value) for name, value in headers]
+	eol = rng.choice(('\r\n', '\n'))
+	head = startLine + eol + ''.join(f"{name}:{' ' * rng.randint(0, 2)}{value}{eol}" for name, value in headers) + eol
+	return head.encode() + body, (startLine, {name.lower(): value for name, value in headers}, body)
+
+def randomStream(seed):
+	"""1-5 pipelined random messages, what they should parse to, and read sizes to cut them into."""
+	rng = random.Random(seed)
+	pairs = [randomRtspMessage(rng) for _ in range(rng.randint(1, 5))]
+	stream = b''.join(data for data, expected in pairs)
+	sizes = [rng.randint(1, 64) for _ in range(8)]
+	return rng, stream, [expected for data, expected in pairs], sizes
+
+def mutate(rng, stream):
+	"""The stream with a few bytes flipped, inserted or dropped."""
+	mutated = bytearray(stream)
+	for _ in range(rng.randint(1, 4)):
+		pos = rng.randrange(len(mutated) + 1)
+		action = rng.random()
+		if action < 0.4 and pos < len(mutated):
+			mutated[pos] = rng.randrange(256)
+		elif action < 0.7:
+			mutated[pos:pos] = bytes((rng.choice((0x0A, 0x0D, 0x3A, 0x20, rng.randrange(256))),))
+		else:
+			del mutated[pos:pos + rng.randint(1, 8)]
+	return bytes(mutated)
+
+@pytest.mark.parametrize('seed', range(CASES))
+def test_valid_stream_round_trips(seed):
+	"""Valid messages, pipelined and cut into reads of random sizes, come out exactly as they went in."""
+	rng, stream, expected, sizes = randomStream(seed)
+	got = [(m.startLine, m.headers, m.body) for m in feedChunks(stream, sizes)]
+	assert got == expected
+
+@pytest.mark.parametrize('seed', range(CASES))
+def test_mutated_stream_fails_only_with_rtsp_error(seed):
+	"""A corrupted stream may fail to parse, but only with RtspError."""
+	rng, stream, expected, sizes = randomStream(seed)
+	try:
+		feedChunks(mutate(rng, stream), sizes)
+	except RtspError:
+		pass